@@ -10,9 +10,38 @@ import json
 import os
 import sys
 import platform
+import shutil
 import argparse
+import queue
+import threading
+import base64
+import select
+import struct
+import ipaddress
+import asyncio
+import math
+import re
+import fnmatch
+import importlib.util
+import traceback
+import signal
+import gzip
+import heapq
+import atexit
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+import multiprocessing
+from collections import OrderedDict, deque
 from pathlib import Path
-from datetime import datetime  # NOVO: Para adicionar timestamps
+from datetime import datetime, timezone  # NOVO: Para adicionar timestamps
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+except ImportError:
+    AESGCM = None
 
 # Configuração de cores para terminal
 class Colors:
@@ -77,47 +106,2237 @@ def get_user_configuration():
         "server_password": ""
     }
     
-    # NOVO: Salvar configuração automaticamente
-    config_path = get_default_config_path()
-    config_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(config_path, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=4)
+    # NOVO: Salvar configuração automaticamente
+    config_path = get_default_config_path()
+    config_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4)
+    
+    return config
+
+def get_default_config_path():
+    """Retorna o path correto do config baseado no SO"""
+    system = platform.system()
+    if system == "Windows":
+        return Path(os.environ['APPDATA']) / "SCDPI" / "config.json"
+    elif "TERMUX" in os.environ:
+        return Path.home() / ".config" / "scdpi" / "config.json"
+    else:
+        return Path.home() / ".config" / "scdpi" / "config.json"
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='SCDPI CHAT - Cliente IRC com Notificações')
+    parser.add_argument('--config', help='Arquivo de configuração personalizado')
+    parser.add_argument('--nick', help='Nickname para usar')
+    parser.add_argument('--channel', help='Canal para entrar')
+    parser.add_argument('--server', help='Servidor IRC')
+    parser.add_argument('--port', type=int, help='Porta do servidor')
+    parser.add_argument('--no-ssl', action='store_true', help='Não usar SSL')
+    parser.add_argument('--verbose', action='store_true', help='Modo detalhado')
+    parser.add_argument('--version', action='store_true', help='Mostrar versão')
+    parser.add_argument('--output', choices=['text', 'jsonl'], default='text',
+                        help='Formato de saída: texto colorido ou um evento JSON por linha')
+    parser.add_argument('--jsonl-backpressure', choices=['block', 'drop'], default='block',
+                        help='Com --output jsonl: bloquear ou descartar eventos se o consumidor for lento')
+    parser.add_argument('--capture', metavar='DIR',
+                        help='Grava os bytes crus enviados/recebidos em DIR (com rotação e compressão)')
+    parser.add_argument('--capture-max-mb', type=int, default=64,
+                        help='Tamanho máximo de cada arquivo de captura em MB')
+    parser.add_argument('--capture-interval', type=int, default=3600,
+                        help='Rotacionar a captura a cada N segundos')
+    parser.add_argument('--replay', metavar='ARQUIVO',
+                        help='Reproduz uma captura (.log ou .log.gz) pelo processamento de mensagens e sai')
+    parser.add_argument('--tui', action='store_true',
+                        help='Interface em tela cheia (curses) com uma janela por canal')
+    parser.add_argument('--bouncer', type=int, nargs='?', const=0, metavar='PORTA',
+                        help='Modo bouncer: compartilha a sessão com clientes IRC locais')
+    parser.add_argument('--swarm', type=int, metavar='N',
+                        help='Teste de carga: abre N sessões headless contra o servidor')
+    parser.add_argument('--scenario', help='Arquivo JSON com o roteiro das sessões do --swarm')
+    parser.add_argument('--swarm-procs', type=int, default=os.cpu_count() or 1,
+                        help='Número de processos usados pelo --swarm')
+    parser.add_argument('--bench-crypto', action='store_true',
+                        help='Medir a vazão de cifragem/decifragem por linha e sair')
+    parser.add_argument('--jsonl-queue', type=int, default=10000,
+                        help='Tamanho máximo da fila de eventos JSON pendentes')
+    return parser.parse_args()
+
+class Settings:
+    """Configuração validada, com valores normalizados e matchers pré-compilados"""
+    
+    CONNECTION_FIELDS = ("server", "port", "use_ssl", "server_password")
+    
+    __slots__ = ("server", "port", "use_ssl", "server_password", "nickname", "realname", "channels",
+                 "highlight_words", "highlight_re", "notify_mentions", "notify_private",
+                 "flood_window", "flood_burst", "encrypted", "encryption", "reply_cache", "dcc")
+    
+    @classmethod
+    def from_config(cls, config):
+        """Valida o dicionário de configuração; levanta ValueError com o campo inválido"""
+        settings = cls()
+        try:
+            settings.server = str(config['server']).strip()
+            settings.port = int(config['port'])
+            settings.nickname = str(config['nickname']).strip()
+        except KeyError as e:
+            raise ValueError(f"campo obrigatório ausente: {e.args[0]}") from None
+        except (TypeError, ValueError):
+            raise ValueError("'port' deve ser um número") from None
+        if not settings.server:
+            raise ValueError("'server' não pode ser vazio")
+        if not 0 < settings.port < 65536:
+            raise ValueError("'port' fora do intervalo 1-65535")
+        if not settings.nickname or ' ' in settings.nickname:
+            raise ValueError("'nickname' é obrigatório e não pode conter espaços")
+        
+        settings.use_ssl = bool(config.get('use_ssl', True))
+        settings.server_password = config.get('server_password') or ''
+        settings.realname = config.get('realname') or f"{settings.nickname} User"
+        channels = config.get('channels', [])
+        if not isinstance(channels, list):
+            raise ValueError("'channels' deve ser uma lista")
+        settings.channels = tuple(c if c[:1] in '#&+!' else '#' + c for c in (str(c).strip() for c in channels) if c)
+        
+        notifications = config.get('notification_settings', {})
+        settings.notify_mentions = bool(notifications.get('enable_mentions', True))
+        settings.notify_private = bool(notifications.get('enable_private_messages', True))
+        settings.highlight_words = tuple(str(w) for w in config.get('highlight_words', []) if str(w).strip())
+        settings.compile_highlights(settings.nickname)
+        
+        try:
+            settings.flood_window = float(config.get('flood_window', 2.0))
+            settings.flood_burst = int(config.get('flood_burst', 5))
+        except (TypeError, ValueError):
+            raise ValueError("'flood_window'/'flood_burst' devem ser números") from None
+        settings.encrypted = bool(config.get('encrypted', False))
+        settings.encryption = config.get('encryption', {})
+        settings.reply_cache = config.get('reply_cache', {})
+        settings.dcc = config.get('dcc', {})
+        return settings
+    
+    def compile_highlights(self, nickname):
+        """Pré-compila o matcher de destaques para o nick em uso"""
+        words = list(self.highlight_words) + ([nickname] if self.notify_mentions else [])
+        self.highlight_re = None
+        if words:
+            self.highlight_re = re.compile(
+                r'(?<![\w\[\]\\`^{}|-])(?:' + '|'.join(re.escape(w) for w in words) + r')(?![\w\[\]\\`^{}|-])',
+                re.IGNORECASE)
+    
+    def connection(self):
+        return tuple(getattr(self, field) for field in self.CONNECTION_FIELDS)
+    
+    def is_highlight(self, text):
+        return bool(self.highlight_re and self.highlight_re.search(text))
+
+def create_ssl_context():
+    """Contexto TLS usado nas conexões IRC (sem verificação de certificado)"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+def registration_lines(config, nickname):
+    """Linhas PASS/USER/NICK que registram uma sessão no servidor"""
+    lines = []
+    if config.get('server_password'):
+        lines.append(f"PASS {config['server_password']}\r\n")
+    lines.append(f"USER {nickname} 0 * :{config.get('realname') or nickname}\r\n")
+    lines.append(f"NICK {nickname}\r\n")
+    return lines
+
+def parse_irc_line(line):
+    """Separa uma linha IRC em tags, prefixo, comando e parâmetros"""
+    tags = {}
+    if line.startswith('@'):
+        raw_tags, _, line = line[1:].partition(' ')
+        for item in raw_tags.split(';'):
+            key, _, value = item.partition('=')
+            tags[key] = value.replace('\\:', ';').replace('\\s', ' ').replace('\\\\', '\\')
+        line = line.lstrip(' ')
+    
+    prefix = ''
+    if line.startswith(':'):
+        prefix, _, line = line[1:].partition(' ')
+        line = line.lstrip(' ')
+    
+    trailing = None
+    if ' :' in line:
+        line, _, trailing = line.partition(' :')
+    elif line.startswith(':'):
+        trailing = line[1:]
+        line = ''
+    params = line.split()
+    command = params.pop(0).upper() if params else ''
+    if trailing is not None:
+        params.append(trailing)
+    
+    return {
+        "tags": tags,
+        "prefix": prefix,
+        "nick": prefix.split('!', 1)[0],
+        "command": command,
+        "params": params,
+        "trailing": trailing,
+    }
+
+class JsonlWriter:
+    """Escreve eventos como JSON lines no stdout a partir de uma thread dedicada"""
+    
+    def __init__(self, stream=None, max_queue=10000, policy='block', batch_size=512):
+        self.stream = stream or sys.stdout.buffer
+        self.policy = policy
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.closed = False
+        self._encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+        self._thread = threading.Thread(target=self._writer_loop, name="jsonl-writer", daemon=True)
+        self._thread.start()
+    
+    def emit(self, event):
+        """Serializa e enfileira um evento (bloqueia ou descarta se a fila estiver cheia)"""
+        if self.closed:
+            return
+        line = self._encode(event) + '\n'
+        if self.policy == 'drop':
+            try:
+                self.queue.put_nowait(line)
+            except queue.Full:
+                self.dropped += 1
+        else:
+            self.queue.put(line)
+    
+    def _writer_loop(self):
+        """Agrupa eventos pendentes em uma única escrita bufferizada"""
+        while True:
+            line = self.queue.get()
+            if line is None:
+                break
+            batch = [line]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    line = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if line is None:
+                    stop = True
+                    break
+                batch.append(line)
+            try:
+                self.stream.write(''.join(batch).encode('utf-8'))
+                self.stream.flush()
+                self.written += len(batch)
+            except (BrokenPipeError, ValueError, OSError):
+                # Consumidor fechou o pipe: descartar o restante sem travar o cliente
+                self.closed = True
+                self.policy = 'drop'
+                while True:
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                break
+            if stop:
+                break
+    
+    def close(self, timeout=5.0):
+        """Descarrega a fila e encerra a thread de escrita"""
+        if not self.closed:
+            self.closed = True
+            try:
+                self.queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        self._thread.join(timeout)
+        if self.dropped:
+            sys.stderr.write(f"scdpi-chat: {self.dropped} eventos JSON descartados por backpressure\n")
+
+class ChannelCrypto:
+    """Cifragem AEAD (AES-GCM) de PRIVMSG por canal ou query, com chaves e cifras em cache"""
+    
+    MARKER = "+SCE1 "
+    NONCE_SIZE = 12
+    TAG_SIZE = 16
+    # Reserva para ":nick!user@host " que o servidor acrescenta ao repassar a linha
+    PREFIX_RESERVE = 120
+    
+    def __init__(self, passphrase=None, keys=None):
+        if AESGCM is None:
+            raise RuntimeError("pacote 'cryptography' não instalado (pip install cryptography)")
+        self.passphrase = passphrase or None
+        self.keys = {}
+        self._ciphers = {}
+        for target, secret in (keys or {}).items():
+            self.set_key(target, secret)
+    
+    @staticmethod
+    def _key_id(target):
+        """Canais derivam a chave com o nome do canal; queries usam um contexto comum aos dois lados"""
+        target = target.lower()
+        return target if target[:1] in '#&+!' else f"query:{target}"
+    
+    def set_key(self, target, secret):
+        """Define o segredo de um alvo (passphrase ou chave trocada em 'base64:...')"""
+        key_id = self._key_id(target)
+        self.keys[key_id] = secret
+        self._ciphers.pop(key_id, None)
+    
+    def remove_key(self, target):
+        """Remove o segredo de um alvo"""
+        key_id = self._key_id(target)
+        self.keys.pop(key_id, None)
+        self._ciphers.pop(key_id, None)
+    
+    def has_key(self, target):
+        """Indica se há segredo configurado para o alvo"""
+        key_id = self._key_id(target)
+        return key_id in self.keys or (self.passphrase is not None and not key_id.startswith("query:"))
+    
+    def _cipher(self, target):
+        """Retorna o AESGCM do alvo, rodando o KDF apenas na primeira vez"""
+        key_id = self._key_id(target)
+        cipher = self._ciphers.get(key_id)
+        if cipher is not None:
+            return cipher, key_id
+        
+        secret = self.keys.get(key_id, self.passphrase)
+        if secret is None:
+            raise KeyError(target)
+        if secret.startswith("base64:"):
+            try:
+                key = base64.b64decode(secret[7:], validate=True)
+            except ValueError:
+                raise ValueError(f"chave de {target} não é base64 válido") from None
+            if len(key) not in (16, 24, 32):
+                raise ValueError(f"chave de {target} deve ter 16, 24 ou 32 bytes")
+        else:
+            salt = b"scdpi-chat/v1/" + (b"query" if key_id.startswith("query:") else key_id.encode('utf-8'))
+            key = Scrypt(salt=salt, length=32, n=2 ** 14, r=8, p=1).derive(secret.encode('utf-8'))
+        
+        cipher = AESGCM(key)
+        self._ciphers[key_id] = cipher
+        return cipher, key_id
+    
+    def max_plaintext(self, target):
+        """Bytes de texto puro que cabem em uma linha de 512 bytes para o alvo"""
+        budget = 512 - self.PREFIX_RESERVE - len(f"PRIVMSG {target} :\r\n") - len(self.MARKER)
+        return (budget // 4) * 3 - self.NONCE_SIZE - self.TAG_SIZE
+    
+    def encrypt(self, target, text):
+        """Cifra o texto e retorna um payload por linha, cada um decifrável isoladamente"""
+        cipher, key_id = self._cipher(target)
+        aad = key_id.encode('utf-8') if not key_id.startswith("query:") else b"query"
+        limit = self.max_plaintext(target)
+        
+        payloads = []
+        data = text.encode('utf-8')
+        while data:
+            cut = min(limit, len(data))
+            # Não cortar no meio de um caractere UTF-8
+            while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+                cut -= 1
+            chunk, data = data[:cut], data[cut:]
+            nonce = os.urandom(self.NONCE_SIZE)
+            sealed = nonce + cipher.encrypt(nonce, chunk, aad)
+            payloads.append(self.MARKER + base64.b64encode(sealed).decode('ascii'))
+        return payloads
+    
+    def decrypt(self, target, payload):
+        """Decifra um payload recebido; levanta ValueError se for inválido"""
+        cipher, key_id = self._cipher(target)
+        aad = key_id.encode('utf-8') if not key_id.startswith("query:") else b"query"
+        try:
+            sealed = base64.b64decode(payload[len(self.MARKER):], validate=True)
+            nonce, body = sealed[:self.NONCE_SIZE], sealed[self.NONCE_SIZE:]
+            return cipher.decrypt(nonce, body, aad).decode('utf-8')
+        except InvalidTag:
+            raise ValueError("mensagem cifrada inválida: autenticação falhou") from None
+        except ValueError as e:
+            raise ValueError(f"mensagem cifrada inválida: {e}") from None
+
+def format_bytes(amount):
+    """Formata um tamanho em bytes de forma legível"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if amount < 1024 or unit == "GB":
+            return f"{amount:.0f} {unit}" if unit == "B" else f"{amount:.1f} {unit}"
+        amount /= 1024
+
+def local_clock(seen):
+    """Hora local (HH:MM:SS) de um timestamp ISO 8601 em UTC do scrollback"""
+    try:
+        when = datetime.strptime(seen[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+        return when.astimezone().strftime("%H:%M:%S")
+    except ValueError:
+        return seen[11:19]
+
+class TokenBucket:
+    """Limitador de banda em bytes/s, compartilhável entre threads (0 = sem limite)"""
+    
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.capacity = max(rate, 64 * 1024)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def consume(self, amount):
+        """Bloqueia até haver banda e retorna quantos bytes foram liberados"""
+        if not self.rate:
+            return amount
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return amount
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+class DccTransfer:
+    """Estado de uma transferência DCC"""
+    
+    def __init__(self, transfer_id, direction, nick, filename, size, path=None):
+        self.id = transfer_id
+        self.direction = direction  # 'send' ou 'recv'
+        self.nick = nick
+        self.filename = filename
+        self.size = size
+        self.path = path
+        self.host = None
+        self.port = 0
+        self.offset = 0
+        self.transferred = 0
+        self.state = "pendente"
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.sock = None
+        self.listener = None
+        self.bucket = None
+        self.cancelled = False
+    
+    def rate(self):
+        """Vazão média em bytes/s desde o início dos dados"""
+        if not self.started:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return (self.transferred - self.offset) / elapsed if elapsed > 0 else 0.0
+    
+    def progress(self):
+        """Percentual concluído"""
+        return 100.0 * self.transferred / self.size if self.size else 100.0
+
+class DccManager:
+    """Transferências DCC SEND/RECV/RESUME/ACCEPT em threads, sem bloquear o chat"""
+    
+    CHUNK = 1024 * 1024
+    CONNECT_TIMEOUT = 120
+    
+    def __init__(self, settings, send_ctcp, echo, local_ip):
+        self.download_dir = Path(settings.get('download_dir') or get_default_config_path().parent / "downloads").expanduser()
+        self.port_range = settings.get('port_range') or [0, 0]
+        self.ip = settings.get('ip') or None
+        self.transfer_rate = int(settings.get('transfer_rate', 0))
+        self.global_bucket = TokenBucket(int(settings.get('max_rate', 0)))
+        self.auto_accept = settings.get('auto_accept', False)
+        self.send_ctcp = send_ctcp
+        self.echo = echo
+        self.local_ip = local_ip
+        self.transfers = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+    
+    def _new_transfer(self, direction, nick, filename, size, path=None):
+        with self.lock:
+            transfer = DccTransfer(self.next_id, direction, nick, filename, size, path)
+            transfer.bucket = TokenBucket(self.transfer_rate)
+            self.transfers[transfer.id] = transfer
+            self.next_id += 1
+        return transfer
+    
+    @staticmethod
+    def parse_args(args):
+        """Separa argumentos DCC respeitando nomes de arquivo entre aspas"""
+        args = args.strip()
+        if args.startswith('"'):
+            end = args.find('"', 1)
+            if end > 0:
+                return [args[1:end]] + args[end + 1:].split()
+        return args.split()
+    
+    @staticmethod
+    def quote(filename):
+        return f'"{filename}"' if ' ' in filename else filename
+    
+    def _throttle(self, transfer, amount):
+        amount = transfer.bucket.consume(amount)
+        return self.global_bucket.consume(amount)
+    
+    # ── Protocolo CTCP ────────────────────────────────────────────
+    
+    def handle_ctcp(self, nick, args):
+        """Processa um CTCP DCC recebido de `nick`"""
+        parts = args.split(' ', 1)
+        kind = parts[0].upper()
+        fields = self.parse_args(parts[1]) if len(parts) > 1 else []
+        try:
+            if kind == "SEND" and len(fields) >= 4:
+                self._offer_received(nick, fields)
+            elif kind == "RESUME" and len(fields) >= 3:
+                self._resume_requested(nick, int(fields[1]), int(fields[2]))
+            elif kind == "ACCEPT" and len(fields) >= 3:
+                self._resume_accepted(nick, int(fields[1]), int(fields[2]))
+            else:
+                self.echo(f"{Colors.YELLOW}⚠️ DCC {kind} de {nick} não suportado{Colors.RESET}", level="warning")
+        except ValueError:
+            self.echo(f"{Colors.RED}❌ DCC malformado de {nick}: {args}{Colors.RESET}", level="error")
+    
+    def _offer_received(self, nick, fields):
+        filename = os.path.basename(fields[0].replace('\\', '/')).lstrip('.') or "arquivo"
+        host, port, size = fields[1], int(fields[2]), int(fields[3])
+        if port == 0:
+            self.echo(f"{Colors.YELLOW}⚠️ DCC passivo de {nick} ({filename}) não suportado{Colors.RESET}",
+                      level="warning")
+            return
+        if host.isdigit():
+            host = str(ipaddress.IPv4Address(int(host)))
+        
+        transfer = self._new_transfer('recv', nick, filename, size, self.download_dir / filename)
+        transfer.host, transfer.port = host, port
+        self.echo(f"{Colors.MAGENTA}📥 DCC SEND de {nick}: {filename} ({format_bytes(size)}) "
+                  f"- use /dcc get {transfer.id}{Colors.RESET}")
+        if self.auto_accept:
+            self.accept(transfer.id)
+    
+    def _resume_requested(self, nick, port, position):
+        for transfer in self.transfers.values():
+            if (transfer.direction == 'send' and transfer.port == port
+                    and transfer.nick.lower() == nick.lower() and transfer.state == "aguardando"):
+                transfer.offset = transfer.transferred = min(position, transfer.size)
+                self.send_ctcp(nick, f"DCC ACCEPT {self.quote(transfer.filename)} {port} {transfer.offset}")
+                self.echo(f"{Colors.BLUE}↪️ DCC #{transfer.id}: {nick} retoma de {format_bytes(transfer.offset)}{Colors.RESET}")
+                return
+    
+    def _resume_accepted(self, nick, port, position):
+        for transfer in self.transfers.values():
+            if (transfer.direction == 'recv' and transfer.port == port
+                    and transfer.nick.lower() == nick.lower() and transfer.state == "retomando"):
+                transfer.offset = transfer.transferred = position
+                self._start(transfer, self._run_recv)
+                return
+    
+    # ── Comandos do usuário ───────────────────────────────────────
+    
+    def accept(self, transfer_id):
+        """Aceita uma oferta recebida, retomando se já houver arquivo parcial"""
+        transfer = self.transfers.get(transfer_id)
+        if not transfer or transfer.direction != 'recv' or transfer.state != "pendente":
+            self.echo(f"{Colors.RED}❌ Nenhuma oferta DCC pendente #{transfer_id}{Colors.RESET}", level="error")
+            return
+        
+        self.download_dir.mkdir(parents=True, exist_ok=True)
+        existing = transfer.path.stat().st_size if transfer.path.exists() else 0
+        if 0 < existing < transfer.size:
+            transfer.state = "retomando"
+            self.send_ctcp(transfer.nick, f"DCC RESUME {self.quote(transfer.filename)} {transfer.port} {existing}")
+            self.echo(f"{Colors.BLUE}↪️ DCC #{transfer.id}: pedindo retomada a partir de {format_bytes(existing)}{Colors.RESET}")
+        else:
+            if transfer.path.exists():
+                # Arquivo completo (ou maior) já existe: nunca sobrescrever, receber com outro nome
+                transfer.path = self._free_path(transfer.path)
+                self.echo(f"{Colors.YELLOW}⚠️ DCC #{transfer.id}: {transfer.filename} já existe, "
+                          f"salvando como {transfer.path.name}{Colors.RESET}", level="warning")
+            self._start(transfer, self._run_recv)
+    
+    @staticmethod
+    def _free_path(path):
+        """Primeiro nome livre no formato arquivo_1.ext, arquivo_2.ext, ..."""
+        counter = 1
+        while True:
+            candidate = path.with_name(f"{path.stem}_{counter}{path.suffix}")
+            if not candidate.exists():
+                return candidate
+            counter += 1
+    
+    def offer(self, nick, path):
+        """Oferece um arquivo local para `nick`"""
+        path = Path(path).expanduser()
+        if not path.is_file():
+            self.echo(f"{Colors.RED}❌ Arquivo não encontrado: {path}{Colors.RESET}", level="error")
+            return
+        
+        transfer = self._new_transfer('send', nick, path.name, path.stat().st_size, path)
+        try:
+            transfer.listener = self._listen()
+        except OSError as e:
+            transfer.state, transfer.error = "falhou", str(e)
+            self.echo(f"{Colors.RED}❌ DCC: não foi possível abrir porta: {e}{Colors.RESET}", level="error")
+            return
+        transfer.port = transfer.listener.getsockname()[1]
+        
+        ip = self.ip or self.local_ip()
+        address = ipaddress.ip_address(ip)
+        host = str(int(address)) if address.version == 4 else ip
+        transfer.state = "aguardando"
+        self.send_ctcp(nick, f"DCC SEND {self.quote(transfer.filename)} {host} {transfer.port} {transfer.size}")
+        self.echo(f"{Colors.BLUE}📤 DCC #{transfer.id}: oferecendo {transfer.filename} "
+                  f"({format_bytes(transfer.size)}) para {nick}{Colors.RESET}")
+        self._start(transfer, self._run_send)
+    
+    def cancel(self, transfer_id):
+        """Cancela uma transferência"""
+        transfer = self.transfers.get(transfer_id)
+        if not transfer:
+            self.echo(f"{Colors.RED}❌ Transferência #{transfer_id} não existe{Colors.RESET}", level="error")
+            return
+        transfer.cancelled = True
+        if transfer.state in ("pendente", "retomando"):
+            transfer.state = "cancelado"
+        for sock in (transfer.sock, transfer.listener):
+            if sock:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+    
+    def status_lines(self):
+        """Linhas de progresso de todas as transferências"""
+        lines = []
+        for t in self.transfers.values():
+            arrow = "⬆️" if t.direction == 'send' else "⬇️"
+            lines.append(f"#{t.id} {arrow} {t.nick} {t.filename} {t.state} "
+                         f"{t.progress():.1f}% ({format_bytes(t.transferred)}/{format_bytes(t.size)}) "
+                         f"{format_bytes(t.rate())}/s" + (f" - {t.error}" if t.error else ""))
+        return lines
+    
+    def shutdown(self):
+        """Cancela tudo que ainda estiver em andamento"""
+        for transfer in list(self.transfers.values()):
+            if transfer.state not in ("concluído", "falhou", "cancelado"):
+                self.cancel(transfer.id)
+    
+    # ── Threads de transferência ──────────────────────────────────
+    
+    def _listen(self):
+        low, high = self.port_range
+        ports = range(low, high + 1) if low else [0]
+        last_error = None
+        for port in ports:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                listener.bind(('', port))
+                listener.listen(1)
+                listener.settimeout(self.CONNECT_TIMEOUT)
+                return listener
+            except OSError as e:
+                listener.close()
+                last_error = e
+        raise last_error
+    
+    def _start(self, transfer, target):
+        thread = threading.Thread(target=self._guard, args=(transfer, target),
+                                  name=f"dcc-{transfer.id}", daemon=True)
+        thread.start()
+    
+    def _guard(self, transfer, target):
+        try:
+            target(transfer)
+        except (OSError, ValueError) as e:
+            if transfer.cancelled:
+                transfer.state = "cancelado"
+            else:
+                transfer.state, transfer.error = "falhou", str(e)
+                self.echo(f"{Colors.RED}❌ DCC #{transfer.id} ({transfer.filename}) falhou: {e}{Colors.RESET}",
+                          level="error")
+        finally:
+            transfer.finished = transfer.finished or time.monotonic()
+            for sock in (transfer.sock, transfer.listener):
+                if sock:
+                    try:
+                        sock.close()
+                    except OSError:
+                        pass
+        if transfer.state == "concluído":
+            elapsed = transfer.finished - transfer.started
+            self.echo(f"{Colors.GREEN}✅ DCC #{transfer.id}: {transfer.filename} concluído "
+                      f"({format_bytes(transfer.transferred - transfer.offset)} em {elapsed:.1f}s, "
+                      f"{format_bytes(transfer.rate())}/s){Colors.RESET}")
+    
+    def _run_send(self, transfer):
+        try:
+            transfer.sock, _ = transfer.listener.accept()
+        except socket.timeout:
+            raise OSError("tempo esgotado aguardando conexão") from None
+        transfer.listener.close()
+        transfer.listener = None
+        transfer.sock.settimeout(60)
+        transfer.state = "enviando"
+        transfer.started = time.monotonic()
+        
+        with open(transfer.path, 'rb') as f:
+            position = transfer.offset
+            while position < transfer.size:
+                if transfer.cancelled:
+                    raise OSError("cancelado")
+                count = self._throttle(transfer, min(self.CHUNK, transfer.size - position))
+                # socket.sendfile usa os.sendfile (zero-copy) em sockets TCP comuns
+                sent = transfer.sock.sendfile(f, offset=position, count=count)
+                if not sent:
+                    raise OSError("conexão fechada pelo receptor")
+                position += sent
+                transfer.transferred = position
+                self._drain_acks(transfer.sock)
+        
+        # Aguarda o receptor confirmar o último byte (ou fechar a conexão)
+        expected = transfer.size & 0xFFFFFFFF
+        deadline = time.monotonic() + 30
+        pending = b''
+        while time.monotonic() < deadline:
+            ready, _, _ = select.select([transfer.sock], [], [], 1.0)
+            if not ready:
+                continue
+            data = transfer.sock.recv(4096)
+            if not data:
+                break
+            pending = (pending + data)[-4:]
+            if len(pending) == 4 and struct.unpack('!I', pending)[0] == expected:
+                break
+        transfer.finished = time.monotonic()
+        transfer.state = "concluído"
+    
+    @staticmethod
+    def _drain_acks(sock):
+        while select.select([sock], [], [], 0)[0]:
+            if not sock.recv(65536):
+                break
+    
+    def _run_recv(self, transfer):
+        transfer.state = "conectando"
+        transfer.sock = socket.create_connection((transfer.host, transfer.port), timeout=self.CONNECT_TIMEOUT)
+        transfer.sock.settimeout(60)
+        transfer.state = "recebendo"
+        transfer.started = time.monotonic()
+        
+        self.download_dir.mkdir(parents=True, exist_ok=True)
+        # 'xb': um arquivo novo nunca substitui outro criado nesse meio-tempo
+        mode = 'r+b' if transfer.offset else 'xb'
+        with open(transfer.path, mode) as f:
+            try:
+                os.posix_fallocate(f.fileno(), transfer.offset, max(transfer.size - transfer.offset, 1))
+            except (AttributeError, OSError):
+                pass
+            f.seek(transfer.offset)
+            
+            buf = bytearray(self.CHUNK)
+            view = memoryview(buf)
+            filled = 0
+            try:
+                while transfer.transferred < transfer.size:
+                    if transfer.cancelled:
+                        raise OSError("cancelado")
+                    wanted = min(len(buf) - filled, transfer.size - transfer.transferred)
+                    received = transfer.sock.recv_into(view[filled:], wanted)
+                    if not received:
+                        raise OSError("conexão fechada pelo remetente")
+                    filled += received
+                    transfer.transferred += received
+                    transfer.sock.sendall(struct.pack('!I', transfer.transferred & 0xFFFFFFFF))
+                    if filled == len(buf):
+                        f.write(view[:filled])
+                        filled = 0
+                    self._throttle(transfer, received)
+            finally:
+                # Gravar o que chegou e cortar a pré-alocação para permitir retomada
+                if filled:
+                    f.write(view[:filled])
+                f.truncate(transfer.transferred)
+        
+        transfer.finished = time.monotonic()
+        transfer.state = "concluído"
+
+def benchmark_crypto(lines=20000, target="#benchmark"):
+    """Mede a vazão de cifragem e decifragem por linha"""
+    crypto = ChannelCrypto(passphrase="benchmark")
+    text = "mensagem de teste com tamanho típico de uma linha de chat " * 2
+    
+    start = time.perf_counter()
+    crypto.encrypt(target, text)
+    kdf_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    payloads = [crypto.encrypt(target, text)[0] for _ in range(lines)]
+    encrypt_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for payload in payloads:
+        crypto.decrypt(target, payload)
+    decrypt_time = time.perf_counter() - start
+    
+    print(f"{Colors.BOLD}🔐 Benchmark de cifragem ({lines} linhas, {len(text)} bytes cada){Colors.RESET}")
+    print(f"Primeira linha (KDF + cifra): {kdf_time * 1000:.1f} ms")
+    print(f"Cifragem:   {lines / encrypt_time:,.0f} linhas/s ({encrypt_time / lines * 1e6:.1f} µs/linha)")
+    print(f"Decifragem: {lines / decrypt_time:,.0f} linhas/s ({decrypt_time / lines * 1e6:.1f} µs/linha)")
+
+class FloodAggregator:
+    """Agrupa rajadas de JOIN/PART/QUIT e netsplits em um resumo por canal"""
+    
+    NETSPLIT_RE = re.compile(r'^([\w*-]+(?:\.[\w*-]+)+) ([\w*-]+(?:\.[\w*-]+)+)$')  # inclui *.net *.split (servidores ocultos)
+    SPLIT_MEMORY = 600
+    SAMPLE_NICKS = 5
+    
+    def __init__(self, window=2.0, burst=5):
+        self.window = window
+        self.burst = burst
+        self.channels = {}
+        self.split_nicks = {}
+    
+    def _bucket(self, channel, now):
+        bucket = self.channels.get(channel)
+        if bucket is None:
+            bucket = self.channels[channel] = {
+                "start": now, "count": 0, "join": 0, "part": 0, "quit": 0,
+                "splits": {}, "netjoins": {}, "nicks": [],
+            }
+        return bucket
+    
+    def add(self, kind, channel, nick, reason=None, now=None):
+        """Registra um evento; retorna True se ele deve ser exibido individualmente"""
+        now = now if now is not None else time.monotonic()
+        bucket = self._bucket(channel, now)
+        bucket["count"] += 1
+        
+        if kind == "quit" and reason:
+            split = self.NETSPLIT_RE.match(reason)
+            if split:
+                servers = split.groups()
+                bucket["splits"][servers] = bucket["splits"].get(servers, 0) + 1
+                self.split_nicks[nick] = (servers, now)
+                return False
+        
+        if kind == "join" and nick in self.split_nicks:
+            servers, when = self.split_nicks[nick]
+            if now - when < self.SPLIT_MEMORY:
+                bucket["netjoins"][servers] = bucket["netjoins"].get(servers, 0) + 1
+                return False
+            del self.split_nicks[nick]
+        
+        if bucket["count"] <= self.burst:
+            return True
+        bucket[kind] += 1
+        if len(bucket["nicks"]) < self.SAMPLE_NICKS:
+            bucket["nicks"].append(nick)
+        return False
+    
+    def flush(self, now=None, force=False):
+        """Fecha as janelas vencidas e retorna [(canal, resumo)]"""
+        now = now if now is not None else time.monotonic()
+        summaries = []
+        for channel in list(self.channels):
+            bucket = self.channels[channel]
+            if not force and now - bucket["start"] < self.window:
+                continue
+            del self.channels[channel]
+            
+            for (left, right), count in bucket["splits"].items():
+                summaries.append((channel, f"Netsplit {left} <-> {right}: {count} quits"))
+            for (left, right), count in bucket["netjoins"].items():
+                summaries.append((channel, f"Netjoin {left} <-> {right}: {count} joins"))
+            parts = []
+            for kind, label in (("join", "entradas"), ("part", "saídas"), ("quit", "quits")):
+                if bucket[kind]:
+                    parts.append(f"{bucket[kind]} {label}")
+            if parts:
+                extra = bucket["join"] + bucket["part"] + bucket["quit"] - len(bucket["nicks"])
+                sample = ", ".join(bucket["nicks"]) + (f" e mais {extra}" if extra > 0 else "")
+                summaries.append((channel, f"Rajada: {', '.join(parts)} ({sample})"))
+        
+        if len(self.split_nicks) > 10000:
+            self.split_nicks = {nick: entry for nick, entry in self.split_nicks.items()
+                                if now - entry[1] < self.SPLIT_MEMORY}
+        return summaries
+
+class ReplyCache:
+    """Cache de respostas WHOIS/WHO/NAMES com TTL, LRU e coalescência de requisições"""
+    
+    PENDING_TIMEOUT = 30
+    
+    def __init__(self, ttl=300, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (tipo, chave) -> (guardado_em, registro)
+        self.pending = {}  # (tipo, chave) -> {"record", "callbacks", "sent"}
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, kind, key):
+        """Registro ainda válido ou None"""
+        entry_key = (kind, key.lower())
+        entry = self.entries.get(entry_key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self.entries[entry_key]
+            return None
+        self.entries.move_to_end(entry_key)
+        return entry[1]
+    
+    def request(self, kind, key, callback, send):
+        """Entrega do cache ou junta-se à consulta em andamento; só envia se necessário"""
+        record = self.get(kind, key)
+        if record is not None:
+            self.hits += 1
+            callback(record, True)
+            return False
+        
+        self.misses += 1
+        entry_key = (kind, key.lower())
+        pending = self.pending.get(entry_key)
+        if pending and time.monotonic() - pending["sent"] < self.PENDING_TIMEOUT:
+            if callback:
+                pending["callbacks"].append(callback)
+            return False
+        self.pending[entry_key] = {"record": None, "callbacks": [callback] if callback else [], "sent": time.monotonic()}
+        send()
+        return True
+    
+    def is_pending(self, kind, key):
+        return (kind, key.lower()) in self.pending
+    
+    def record(self, kind, key, factory):
+        """Registro em montagem para uma resposta multi-linha"""
+        entry_key = (kind, key.lower())
+        pending = self.pending.get(entry_key)
+        if pending is None:
+            # Resposta não solicitada (ex.: NAMES após JOIN): também vai para o cache
+            pending = self.pending[entry_key] = {"record": None, "callbacks": [], "sent": time.monotonic()}
+        if pending["record"] is None:
+            pending["record"] = factory()
+        return pending["record"]
+    
+    def complete(self, kind, key):
+        """Fecha o registro, guarda no LRU e notifica quem estava esperando"""
+        pending = self.pending.pop((kind, key.lower()), None)
+        if pending is None or pending["record"] is None:
+            return None
+        # Erros (ex.: 401 "No such nick") só vão para quem perguntou: o nick pode surgir a qualquer momento
+        if not pending["record"].get("error"):
+            self.store(kind, key, pending["record"])
+        for callback in pending["callbacks"]:
+            callback(pending["record"], False)
+        return pending["record"]
+    
+    def store(self, kind, key, record):
+        entry_key = (kind, key.lower())
+        self.entries[entry_key] = (time.monotonic(), record)
+        self.entries.move_to_end(entry_key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, kind, key):
+        self.entries.pop((kind, key.lower()), None)
+    
+    def values(self, kind):
+        """Registros guardados de um tipo (para atualização por eventos ao vivo)"""
+        return [record for (entry_kind, _), (_, record) in self.entries.items() if entry_kind == kind]
+    
+    # ── Atualização a partir de eventos ao vivo ─────────────────
+    
+    def nick_changed(self, old, new):
+        self.invalidate("whois", new)
+        record = self.entries.pop(("whois", old.lower()), None)
+        if record is not None:
+            record[1]["nick"] = new
+            self.entries[("whois", new.lower())] = record
+        for names in self.values("names"):
+            if old in names["names"]:
+                names["names"][new] = names["names"].pop(old)
+        for who in self.values("who"):
+            for user in who["users"]:
+                if user["nick"] == old:
+                    user["nick"] = new
+    
+    def away_changed(self, nick, message):
+        whois = self.get("whois", nick)
+        if whois is not None:
+            whois["away"] = message
+    
+    def member_joined(self, channel, nick):
+        self.invalidate("whois", nick)
+        names = self.get("names", channel)
+        if names is not None:
+            names["names"].setdefault(nick, '')
+    
+    def member_left(self, channel, nick):
+        names = self.get("names", channel)
+        if names is not None:
+            names["names"].pop(nick, None)
+    
+    def user_quit(self, nick):
+        self.invalidate("whois", nick)
+        for names in self.values("names"):
+            names["names"].pop(nick, None)
+        for who in self.values("who"):
+            who["users"] = [user for user in who["users"] if user["nick"] != nick]
+
+class ChannelDirectory:
+    """Índice local e compacto do /list: nome, usuários e tópico de cada canal"""
+    
+    def __init__(self):
+        self.names = []
+        self.users = array('I')
+        self.topics = []
+        self.positions = {}
+        self.server_filter = None
+        self.collecting = False
+        self.completed_at = None
+    
+    def begin(self, server_filter):
+        """Descarta o índice anterior e começa a receber um novo LIST"""
+        self.names, self.users, self.topics, self.positions = [], array('I'), [], {}
+        self.server_filter = server_filter
+        self.collecting = True
+        self.completed_at = None
+    
+    def add(self, name, users, topic):
+        """Ingere uma linha 322"""
+        if not self.collecting:
+            self.begin(None)
+        key = name.lower()
+        position = self.positions.get(key)
+        if position is None:
+            self.positions[key] = len(self.names)
+            self.names.append(name)
+            self.users.append(users)
+            self.topics.append(topic)
+        else:
+            self.users[position] = users
+            self.topics[position] = topic
+    
+    def finish(self):
+        self.collecting = False
+        self.completed_at = time.monotonic()
+    
+    def covers(self, server_filter, ttl):
+        """Indica se o índice guardado responde a um pedido com esse filtro"""
+        if self.completed_at is None or time.monotonic() - self.completed_at > ttl:
+            return False
+        return self.filter_covers(self.server_filter, server_filter)
+    
+    @staticmethod
+    def filter_covers(cached, server_filter):
+        """Um LIST com o filtro `cached` contém todos os canais de `server_filter`?"""
+        if cached is None:
+            return True
+        if server_filter is None:
+            return False
+        cached_min, cached_mask = cached
+        wanted_min, wanted_mask = server_filter
+        return cached_min <= wanted_min and cached_mask in (None, wanted_mask)
+    
+    def query(self, min_users=0, max_users=None, match=None, topic=None, sort="users", page=1, page_size=50):
+        """Filtra, ordena e pagina o índice; retorna (total, linhas da página)"""
+        pattern = None
+        if match:
+            pattern = match.lower() if any(c in match for c in '*?[') else f"*{match.lower()}*"
+        topic = topic.lower() if topic else None
+        
+        selected = []
+        for position, users in enumerate(self.users):
+            if users < min_users or (max_users is not None and users > max_users):
+                continue
+            if pattern and not fnmatch.fnmatchcase(self.names[position].lower(), pattern):
+                continue
+            if topic and topic not in self.topics[position].lower():
+                continue
+            selected.append(position)
+        
+        if sort == "name":
+            selected.sort(key=lambda p: self.names[p].lower())
+        elif sort == "topic":
+            selected.sort(key=lambda p: self.topics[p].lower())
+        else:
+            selected.sort(key=lambda p: -self.users[p])
+        
+        start = (page - 1) * page_size
+        rows = [(self.names[p], self.users[p], self.topics[p]) for p in selected[start:start + page_size]]
+        return len(selected), rows
+    
+    def __len__(self):
+        return len(self.names)
+
+class PluginAPI:
+    """Interface entregue à função register(api) de cada plugin"""
+    
+    def __init__(self, manager, name):
+        self._manager = manager
+        self.name = name
+    
+    def on(self, event, handler):
+        """Inscreve handler(evento) em um comando IRC ('PRIVMSG', '001', '*'), 'send', 'connect' ou 'disconnect'"""
+        self._manager.subscribe(self.name, event, handler)
+    
+    def send(self, line):
+        """Enfileira uma linha IRC crua para o servidor (enviada pela thread principal)"""
+        self._manager.outbox.put(line if line.endswith("\r\n") else line + "\r\n")
+    
+    def echo(self, text):
+        """Exibe texto no cliente (pela thread principal)"""
+        self._manager.outbox.put(("echo", f"[{self.name}] {text}"))
+    
+    @property
+    def config(self):
+        return self._manager.config
+
+class PluginStats:
+    """Tempo e contadores de um plugin"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.errors = 0
+        self.timeouts = 0
+        self.dropped = 0
+        self.inflight = 0
+
+class PluginManager:
+    """Carrega plugins de um diretório sob demanda e roda seus handlers em um pool limitado"""
+    
+    def __init__(self, directory, config, echo, max_workers=4, timeout=5.0, max_inflight=8):
+        self.directory = Path(directory).expanduser()
+        self.config = config
+        self.echo = echo
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+        self.handlers = {}  # evento -> [(plugin, handler)]
+        self.stats = {}
+        self.outbox = queue.Queue()
+        self.running = []  # (future, plugin, evento, início)
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.executor = None
+    
+    def subscribe(self, plugin, event, handler):
+        event = event if event in ("send", "connect", "disconnect") else event.upper()
+        self.handlers.setdefault(event, []).append((plugin, handler))
+    
+    def load(self):
+        """Importa os plugins na primeira vez que algum evento precisa deles"""
+        self.loaded = True
+        if not self.directory.is_dir():
+            return
+        for path in sorted(self.directory.glob("*.py")):
+            name = path.stem
+            try:
+                spec = importlib.util.spec_from_file_location(f"scdpi_plugin_{name}", path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                module.register(PluginAPI(self, name))
+                self.stats[name] = PluginStats()
+                self.echo(f"{Colors.GREEN}🧩 Plugin carregado: {name}{Colors.RESET}")
+            except Exception as e:
+                # Descartar o que o register() chegou a inscrever antes de falhar
+                for event in list(self.handlers):
+                    self.handlers[event] = [entry for entry in self.handlers[event] if entry[0] != name]
+                    if not self.handlers[event]:
+                        del self.handlers[event]
+                self.echo(f"{Colors.RED}❌ Plugin {name} falhou ao carregar: {e}{Colors.RESET}", level="error")
+        if self.handlers:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="plugin")
+    
+    def dispatch(self, event, payload):
+        """Agenda os handlers inscritos no evento; só toca em plugins interessados"""
+        if not self.loaded:
+            self.load()
+        handlers = self.handlers.get(event)
+        wildcard = self.handlers.get("*") if event not in ("send", "connect", "disconnect") else None
+        if not handlers and not wildcard:
+            return
+        for plugin, handler in (handlers or []) + (wildcard or []):
+            stats = self.stats[plugin]
+            if stats.inflight >= self.max_inflight:
+                # Backpressure: plugin lento não acumula trabalho infinito
+                stats.dropped += 1
+                continue
+            with self.lock:
+                stats.inflight += 1
+            future = self.executor.submit(self._call, plugin, handler, payload)
+            self.running.append((future, plugin, event, time.monotonic()))
+    
+    def _call(self, plugin, handler, payload):
+        stats = self.stats[plugin]
+        started = time.perf_counter()
+        try:
+            handler(payload)
+        except Exception:
+            with self.lock:
+                stats.errors += 1
+            self.outbox.put(("echo", f"[{plugin}] erro: {traceback.format_exc(limit=2).strip().splitlines()[-1]}"))
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                stats.calls += 1
+                stats.total_time += elapsed
+                stats.max_time = max(stats.max_time, elapsed)
+                stats.inflight -= 1
+    
+    def poll(self, send):
+        """Na thread principal: envia linhas dos plugins e marca chamadas que estouraram o timeout"""
+        while True:
+            try:
+                item = self.outbox.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                self.echo(f"{Colors.MAGENTA}🧩 {item[1]}{Colors.RESET}")
+            else:
+                send(item)
+        
+        if not self.running:
+            return
+        now = time.monotonic()
+        still_running = []
+        for future, plugin, event, started in self.running:
+            if future.done():
+                continue
+            if started is not None and now - started > self.timeout:
+                self.stats[plugin].timeouts += 1
+                self.echo(f"{Colors.YELLOW}⚠️ Plugin {plugin} passou de {self.timeout:g}s em {event}{Colors.RESET}",
+                          level="warning")
+                started = None  # contar o timeout uma única vez
+            still_running.append((future, plugin, event, started))
+        self.running = still_running
+    
+    def report(self):
+        """Linhas com o tempo gasto por plugin"""
+        lines = []
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].total_time):
+            average = stats.total_time / stats.calls * 1000 if stats.calls else 0.0
+            lines.append(f"{name}: {stats.calls} chamadas, {stats.total_time:.3f}s total, "
+                         f"média {average:.2f}ms, máx {stats.max_time * 1000:.1f}ms, "
+                         f"{stats.errors} erros, {stats.timeouts} timeouts, {stats.dropped} descartadas")
+        return lines
+    
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+
+class SessionStore:
+    """Snapshot compacto da sessão (canais, tópicos, membros, última mensagem e scrollback) em disco"""
+    
+    VERSION = 1
+    
+    def __init__(self, config):
+        name = re.sub(r'[^\w.-]', '_', f"{config['server']}-{config['port']}")
+        self.path = get_default_config_path().parent / "sessions" / f"{name}.json"
+    
+    def load(self):
+        """Snapshot salvo ou None se ausente/ilegível"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if data.get("version") == self.VERSION else None
+    
+    def save(self, data):
+        """Grava de forma atômica (arquivo temporário + rename)"""
+        data["version"] = self.VERSION
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        if platform.system() != "Windows":
+            os.chmod(tmp, 0o600)
+        os.replace(tmp, self.path)
+
+class SpaceSaving:
+    """Heavy hitters aproximados (algoritmo Space-Saving) com no máximo k contadores"""
+    
+    __slots__ = ("capacity", "counts")
+    
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}  # item -> [contagem, erro máximo]
+    
+    def add(self, item):
+        entry = self.counts.get(item)
+        if entry is not None:
+            entry[0] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = [1, 0]
+        else:
+            # Substitui o menor contador; k é fixo, então a varredura tem custo constante
+            victim = min(self.counts, key=lambda key: self.counts[key][0])
+            floor = self.counts.pop(victim)[0]
+            self.counts[item] = [floor + 1, floor]
+    
+    def top(self, n):
+        """[(item, contagem estimada, erro máximo)] em ordem decrescente"""
+        ranked = sorted(self.counts.items(), key=lambda item: -item[1][0])[:n]
+        return [(item, count, error) for item, (count, error) in ranked]
+
+class DecayedRate:
+    """Taxa com decaimento exponencial (eventos por minuto) em memória constante"""
+    
+    __slots__ = ("tau", "value", "stamp")
+    
+    def __init__(self, tau):
+        self.tau = tau
+        self.value = 0.0
+        self.stamp = None
+    
+    def add(self, now, amount=1.0):
+        self.value = self.current(now) + amount
+        self.stamp = now
+    
+    def current(self, now):
+        if self.stamp is None:
+            return 0.0
+        return self.value * math.exp(-(now - self.stamp) / self.tau)
+    
+    def per_minute(self, now):
+        return self.current(now) * 60.0 / self.tau
+
+class ChannelStats:
+    """Estatísticas de um canal com memória fixa, independente do volume"""
+    
+    URL_RE = re.compile(r'https?://[^\s<>"]+')
+    WORD_RE = re.compile(r"[^\W\d_][\w'-]{3,}")
+    STOPWORDS = frozenset("""
+        para como mais isso esse essa este esta pelo pela quando onde porque ainda também muito você
+        vocês eles elas nosso nossa aqui agora então depois antes sobre entre mesmo tudo nada cada
+        that this with have from what your they will would there their about which when just like
+        been were into then than them some could know here yeah okay
+    """.split())
+    MAX_WORDS = 20
+    
+    __slots__ = ("messages", "short", "long", "talkers", "urls", "keywords", "last_spike")
+    
+    def __init__(self):
+        self.messages = 0
+        self.short = DecayedRate(60.0)
+        self.long = DecayedRate(900.0)
+        self.talkers = SpaceSaving(20)
+        self.urls = SpaceSaving(20)
+        self.keywords = SpaceSaving(30)
+        self.last_spike = 0.0
+    
+    def add(self, nick, text, now):
+        """Atualiza todas as estruturas com uma mensagem (custo limitado por mensagem)"""
+        self.messages += 1
+        self.short.add(now)
+        self.long.add(now)
+        self.talkers.add(nick)
+        for url in self.URL_RE.findall(text)[:3]:
+            self.urls.add(url.rstrip('.,;:!?)'))
+        text = self.URL_RE.sub(' ', text)
+        for word in self.WORD_RE.findall(text.lower())[:self.MAX_WORDS]:
+            if word not in self.STOPWORDS:
+                self.keywords.add(word)
+    
+    def spike(self, now, factor=4.0, minimum=10.0, cooldown=300.0):
+        """Retorna (taxa, normal) se a taxa recente disparou acima do normal"""
+        if self.messages < 50 or now - self.last_spike < cooldown:
+            return None
+        rate, normal = self.short.per_minute(now), self.long.per_minute(now)
+        if rate >= minimum and rate > factor * normal:
+            self.last_spike = now
+            return rate, normal
+        return None
+
+class CaptureWriter:
+    """Grava o tráfego cru em disco a partir de uma thread, com rotação e compressão gzip"""
+    
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_age=3600, queue_size=20000):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.file = None
+        self._thread = threading.Thread(target=self._writer_loop, name="capture-writer", daemon=True)
+        self._thread.start()
+    
+    def record(self, direction, data):
+        """Caminho quente: apenas enfileira (descarta se o disco não acompanhar)"""
+        try:
+            self.queue.put_nowait((time.time(), direction, data))
+        except queue.Full:
+            self.dropped += 1
+    
+    def _open(self):
+        name = datetime.now().strftime("capture-%Y%m%d-%H%M%S")
+        path = self.directory / f"{name}.log"
+        suffix = 1
+        while path.exists() or path.with_suffix(".log.gz").exists():
+            path = self.directory / f"{name}-{suffix}.log"
+            suffix += 1
+        self.path = path
+        self.file = open(path, 'wb', buffering=1024 * 1024)
+        self.opened = time.monotonic()
+        self.size = 0
+    
+    def _rotate(self):
+        self.file.close()
+        self.file = None
+        with open(self.path, 'rb') as source, gzip.open(f"{self.path}.gz", 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.remove(self.path)
+    
+    def _writer_loop(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item:
+                if self.file is None:
+                    self._open()
+                batch = [item]
+                while len(batch) < 1024:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self.queue.put(None)
+                        break
+                    batch.append(item)
+                chunks = []
+                for stamp, direction, data in batch:
+                    chunks.append(f"{stamp:.6f} {direction} {len(data)}\n".encode('ascii'))
+                    chunks.append(data)
+                    chunks.append(b"\n")
+                payload = b''.join(chunks)
+                self.file.write(payload)
+                self.size += len(payload)
+            if self.file is not None and (self.size >= self.max_bytes or time.monotonic() - self.opened >= self.max_age):
+                self._rotate()
+        if self.file is not None:
+            self._rotate()
+    
+    def close(self, timeout=10.0):
+        self.queue.put(None)
+        self._thread.join(timeout)
+        if self.dropped:
+            sys.stderr.write(f"scdpi-chat: {self.dropped} registros de captura descartados\n")
+
+def read_capture(path):
+    """Lê uma captura (.log ou .log.gz) e gera (timestamp, direção, bytes)"""
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, 'rb') as f:
+        while True:
+            header = f.readline()
+            if not header:
+                break
+            stamp, direction, length = header.split()
+            data = f.read(int(length))
+            f.read(1)
+            yield float(stamp), direction.decode('ascii'), data
+
+class ActivityEntry:
+    __slots__ = ('name', 'unread', 'highlights', 'level', 'since', 'last_read')
+    
+    def __init__(self, name):
+        self.name = name
+        self.unread = 0
+        self.highlights = 0
+        self.level = 0  # 0 = lido, 1 = mensagens, 2 = destaque/privado
+        self.since = 0  # ordem em que o canal passou a ter não lidas
+        self.last_read = None  # time.time() da última leitura
+
+class ActivityTracker:
+    """Não lidas e destaques por canal, com índice de prioridade em heap para o /next"""
+    
+    def __init__(self):
+        self.entries = {}  # canal (minúsculo) -> ActivityEntry
+        self.heap = []  # (-nível, since, canal); entradas obsoletas são descartadas ao consultar
+        self.seq = 0
+    
+    def get(self, channel):
+        return self.entries.get(channel.lower()) if channel else None
+    
+    def add(self, channel, highlight=False, active=False):
+        """Conta uma mensagem; o heap só muda quando o nível do canal sobe"""
+        key = channel.lower()
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = ActivityEntry(channel)
+        if active:
+            entry.last_read = time.time()
+            return
+        entry.unread += 1
+        level = 1
+        if highlight:
+            entry.highlights += 1
+            level = 2
+        if level > entry.level:
+            if not entry.level:
+                self.seq += 1
+                entry.since = self.seq
+            entry.level = level
+            heapq.heappush(self.heap, (-level, entry.since, key))
+            if len(self.heap) > 2 * len(self.entries) + 32:
+                self.compact()
+    
+    def _valid(self, item):
+        entry = self.entries.get(item[2])
+        return entry is not None and entry.level == -item[0] and entry.since == item[1]
+    
+    def compact(self):
+        self.heap = [item for item in self.heap if self._valid(item)]
+        heapq.heapify(self.heap)
+    
+    def mark_read(self, channel):
+        entry = self.entries.get(channel.lower())
+        if entry is None:
+            entry = self.entries[channel.lower()] = ActivityEntry(channel)
+        entry.unread = entry.highlights = entry.level = 0
+        entry.last_read = time.time()
+    
+    def remove(self, channel):
+        self.entries.pop(channel.lower(), None)
+    
+    def next(self):
+        """Canal mais importante com não lidas: destaques primeiro, depois o que espera há mais tempo"""
+        while self.heap:
+            if self._valid(self.heap[0]):
+                return self.entries[self.heap[0][2]].name
+            heapq.heappop(self.heap)
+        return None
+    
+    def pending(self):
+        """Todos os canais com não lidas, na ordem de prioridade"""
+        waiting = [entry for entry in self.entries.values() if entry.level]
+        return sorted(waiting, key=lambda entry: (-entry.level, entry.since))
+
+ANSI_SGR = re.compile(r'\033\[([0-9;]*)m')
+
+def cell_width(char):
+    """Colunas ocupadas por um caractere no terminal (emojis e CJK ocupam duas)"""
+    if unicodedata.category(char) in ('Mn', 'Me', 'Cf'):
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1
+
+def wrap_cells(text, width):
+    """Quebra o texto em pedaços de no máximo `width` colunas"""
+    chunks, current, used = [], [], 0
+    for char in text:
+        size = cell_width(char)
+        if used + size > width and current:
+            chunks.append(''.join(current))
+            current, used = [], 0
+        current.append(char)
+        used += size
+    chunks.append(''.join(current))
+    return chunks
+
+class ChatWindow:
+    """Janela da TUI: linhas de um canal, query ou do status"""
+    
+    __slots__ = ('name', 'lines', 'total', 'marker', 'scroll')
+    
+    def __init__(self, name, scrollback):
+        self.name = name
+        self.lines = deque(maxlen=scrollback)  # (cor ANSI, negrito, texto sem escapes)
+        self.total = 0  # linhas já recebidas, inclusive as que saíram do buffer
+        self.marker = None  # valor de `total` quando a janela foi deixada (última leitura)
+        self.scroll = 0  # linhas acima do fim (0 = acompanhando)
+
+class TerminalUI:
+    """Interface curses em tela cheia: lista de janelas, mensagens, status e linha de entrada"""
+    
+    STATUS = "*status*"
+    LIST_WIDTH = 18
+    COLOR_CODES = {'91': 1, '92': 2, '93': 3, '94': 4, '95': 5, '96': 6, '97': 7}
+    
+    def __init__(self, activity, on_switch=None, max_fps=20, scrollback=1000):
+        import curses  # indisponível no Windows sem o pacote windows-curses
+        self.curses = curses
+        self.activity = activity
+        self.on_switch = on_switch
+        self.frame_interval = 1.0 / max(1, max_fps)
+        self.scrollback = scrollback
+        self.lock = threading.RLock()
+        self.windows = OrderedDict()  # nome (minúsculo) -> ChatWindow, na ordem de abertura
+        self.windows[self.STATUS] = ChatWindow(self.STATUS, scrollback)
+        self.active = self.STATUS
+        self.dirty = set()
+        self.drawn = 0.0
+        self.nick = ''
+        self.lag = None
+        self.input = ''
+        self.cursor = 0
+        self.history = deque(maxlen=200)
+        self.history_pos = None
+        self.escape = False
+        self.screen = None
+    
+    def start(self):
+        curses = self.curses
+        self.screen = curses.initscr()
+        curses.noecho()
+        curses.cbreak()
+        self.screen.keypad(True)
+        self.screen.nodelay(True)
+        try:
+            curses.start_color()
+            curses.use_default_colors()
+            for code, pair in self.COLOR_CODES.items():
+                curses.init_pair(pair, (curses.COLOR_RED, curses.COLOR_GREEN, curses.COLOR_YELLOW, curses.COLOR_BLUE,
+                                        curses.COLOR_MAGENTA, curses.COLOR_CYAN, curses.COLOR_WHITE)[pair - 1], -1)
+        except curses.error:
+            pass  # terminal sem cores
+        atexit.register(self.stop)
+        self.layout()
+    
+    def stop(self):
+        if self.screen is None:
+            return
+        curses = self.curses
+        try:
+            self.screen.keypad(False)
+            curses.nocbreak()
+            curses.echo()
+            curses.endwin()
+        except curses.error:
+            pass
+        self.screen = None
+    
+    def layout(self):
+        """(Re)cria as sub-janelas a partir do tamanho atual do terminal"""
+        curses = self.curses
+        height, width = self.screen.getmaxyx()
+        height, width = max(height, 4), max(width, 20)
+        side = min(self.LIST_WIDTH, width // 4)
+        self.list_win = curses.newwin(height - 2, side, 0, 0)
+        self.pane_win = curses.newwin(height - 2, width - side, 0, side)
+        self.status_win = curses.newwin(1, width, height - 2, 0)
+        self.input_win = curses.newwin(1, width, height - 1, 0)
+        self.screen.erase()
+        self.screen.noutrefresh()
+        self.dirty = {'list', 'pane', 'status', 'input'}
+    
+    def key(self, name):
+        return (name or self.STATUS).lower()
+    
+    def ensure(self, name):
+        """Janela do canal/query, criada na primeira linha recebida"""
+        key = self.key(name)
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None:
+                window = self.windows[key] = ChatWindow(name, self.scrollback)
+                self.dirty.add('list')
+            return window
+    
+    def add_line(self, name, text, activity=None):
+        """Acrescenta uma linha (com cores ANSI) à janela; só marca as regiões afetadas"""
+        codes = ANSI_SGR.findall(text)
+        color = next((code for group in codes for code in group.split(';') if code in self.COLOR_CODES), None)
+        bold = any('1' in group.split(';') for group in codes)
+        plain = ANSI_SGR.sub('', text)
+        with self.lock:
+            window = self.ensure(name if name is not None else self.windows[self.active].name)
+            for line in plain.split('\n'):
+                window.lines.append((color, bold, line))
+                window.total += 1
+            if self.key(window.name) == self.active:
+                if window.scroll:
+                    window.scroll = min(window.scroll + 1, len(window.lines))
+                else:
+                    self.dirty.add('pane')
+            elif activity:
+                # Os contadores ficam no ActivityTracker; aqui só muda o que está na tela
+                self.dirty.update(('list', 'status'))
+    
+    def clear(self):
+        with self.lock:
+            window = self.windows[self.active]
+            window.lines.clear()
+            window.scroll = 0
+            self.dirty.add('pane')
+    
+    def switch(self, name):
+        """Ativa a janela (criando-a se preciso); a anterior guarda o marcador de leitura"""
+        with self.lock:
+            window = self.ensure(name)
+            previous = self.windows[self.active]
+            if previous is not window:
+                previous.marker = previous.total
+            self.active = self.key(window.name)
+            self.dirty.update(('list', 'pane', 'status', 'input'))
+        if self.on_switch:
+            self.on_switch(None if self.active == self.STATUS else window.name)
+    
+    def window_at(self, number):
+        """Nome da janela pela posição na lista (1 = status)"""
+        windows = list(self.windows.values())
+        return windows[number - 1].name if 1 <= number <= len(windows) else None
+    
+    def cycle(self, step):
+        keys = list(self.windows)
+        self.switch(self.windows[keys[(keys.index(self.active) + step) % len(keys)]].name)
+    
+    def set_status(self, nick, lag):
+        if (nick, lag) != (self.nick, self.lag):
+            self.nick, self.lag = nick, lag
+            self.dirty.add('status')
+    
+    def scroll(self, pages):
+        with self.lock:
+            window = self.windows[self.active]
+            step = max(1, self.pane_win.getmaxyx()[0] - 2)
+            window.scroll = max(0, min(len(window.lines) - 1, window.scroll + pages * step))
+            self.dirty.update(('pane', 'status'))
+    
+    def poll_input(self):
+        """Lê as teclas pendentes sem bloquear; retorna as linhas confirmadas com Enter"""
+        curses = self.curses
+        submitted = []
+        while self.screen is not None:
+            try:
+                key = self.screen.get_wch()
+            except curses.error:
+                break
+            self.dirty.add('input')
+            if self.escape:
+                # Alt-A: próxima atividade; Alt-1..9: janela pelo número
+                self.escape = False
+                if key in ('a', 'A'):
+                    submitted.append("/next")
+                    continue
+                if isinstance(key, str) and key in '123456789':
+                    submitted.append(f"/w {key}")
+                    continue
+            if key == '\x1b':
+                self.escape = True
+            elif key in ('\n', '\r', curses.KEY_ENTER):
+                line = self.input.strip()
+                if line:
+                    submitted.append(line)
+                    self.history.append(line)
+                self.input, self.cursor, self.history_pos = '', 0, None
+            elif key in ('\x7f', '\b', curses.KEY_BACKSPACE):
+                if self.cursor:
+                    self.input = self.input[:self.cursor - 1] + self.input[self.cursor:]
+                    self.cursor -= 1
+            elif key == curses.KEY_DC:
+                self.input = self.input[:self.cursor] + self.input[self.cursor + 1:]
+            elif key == curses.KEY_LEFT:
+                self.cursor = max(0, self.cursor - 1)
+            elif key == curses.KEY_RIGHT:
+                self.cursor = min(len(self.input), self.cursor + 1)
+            elif key in (curses.KEY_HOME, '\x01'):
+                self.cursor = 0
+            elif key in (curses.KEY_END, '\x05'):
+                self.cursor = len(self.input)
+            elif key == '\x15':  # Ctrl-U
+                self.input, self.cursor = '', 0
+            elif key in (curses.KEY_UP, curses.KEY_DOWN) and self.history:
+                if self.history_pos is None:
+                    self.history_pos = len(self.history)
+                step = -1 if key == curses.KEY_UP else 1
+                self.history_pos = max(0, min(len(self.history), self.history_pos + step))
+                self.input = self.history[self.history_pos] if self.history_pos < len(self.history) else ''
+                self.cursor = len(self.input)
+            elif key == '\x0e':  # Ctrl-N
+                self.cycle(1)
+            elif key == '\x10':  # Ctrl-P
+                self.cycle(-1)
+            elif key == curses.KEY_PPAGE:
+                self.scroll(1)
+            elif key == curses.KEY_NPAGE:
+                self.scroll(-1)
+            elif key == curses.KEY_RESIZE:
+                curses.update_lines_cols()
+                self.layout()
+            elif isinstance(key, str) and key.isprintable():
+                self.input = self.input[:self.cursor] + key + self.input[self.cursor:]
+                self.cursor += 1
+        return submitted
+    
+    def attr(self, color, bold):
+        value = self.curses.color_pair(self.COLOR_CODES[color]) if color and self.curses.has_colors() else 0
+        return value | (self.curses.A_BOLD if bold else 0)
+    
+    def render(self, force=False):
+        """Redesenha só as regiões sujas, no máximo `max_fps` vezes por segundo"""
+        now = time.monotonic()
+        if self.screen is None or not self.dirty or (not force and now - self.drawn < self.frame_interval):
+            return False
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            try:
+                if 'list' in dirty:
+                    self._draw_list()
+                if 'pane' in dirty:
+                    self._draw_pane()
+                if 'status' in dirty:
+                    self._draw_status()
+                self._draw_input(redraw='input' in dirty)
+                self.curses.doupdate()
+            except self.curses.error:
+                pass  # terminal pequeno demais durante um resize
+        self.drawn = now
+        return True
+    
+    def _put(self, win, y, x, text, attr=0):
+        try:
+            win.addstr(y, x, text, attr)
+        except self.curses.error:
+            pass  # escrever na última célula da janela sempre "falha"
+    
+    def _draw_list(self):
+        win = self.list_win
+        height, width = win.getmaxyx()
+        win.erase()
+        for row, (key, window) in enumerate(list(self.windows.items())[:height]):
+            label = f"{row + 1} {window.name}"
+            entry = self.activity.get(window.name)
+            if entry and entry.unread:
+                label += f" {entry.unread}"
+            if key == self.active:
+                attr = self.curses.A_REVERSE
+            elif entry and entry.highlights:
+                attr = self.attr('93', True)
+            elif entry and entry.unread:
+                attr = self.curses.A_BOLD
+            else:
+                attr = 0
+            self._put(win, row, 0, wrap_cells(label, width - 2)[0], attr)
+        win.vline(0, width - 1, self.curses.ACS_VLINE, height)
+        win.noutrefresh()
+    
+    def _draw_pane(self):
+        win = self.pane_win
+        height, width = win.getmaxyx()
+        window = self.windows[self.active]
+        rows = []
+        skip = window.scroll
+        position = window.total
+        # Percorre do fim para o começo só até preencher a altura visível
+        for color, bold, text in reversed(window.lines):
+            position -= 1
+            if skip:
+                skip -= 1
+                continue
+            attr = self.attr(color, bold)
+            for chunk in reversed(wrap_cells(text, width - 1)):
+                rows.append((attr, chunk))
+            if position == window.marker:
+                # Marcador de leitura: acima dele o que já tinha sido visto
+                rows.append((self.curses.A_DIM, wrap_cells("── não lidas " + "─" * width, width - 1)[0]))
+            if len(rows) >= height:
+                break
+        rows = rows[:height]
+        win.erase()
+        top = height - len(rows)
+        for offset, (attr, chunk) in enumerate(reversed(rows)):
+            self._put(win, top + offset, 0, chunk, attr)
+        win.noutrefresh()
+    
+    def _draw_status(self):
+        win = self.status_win
+        width = win.getmaxyx()[1]
+        window = self.windows[self.active]
+        lag = f"{self.lag:.2f}s" if self.lag is not None else "?"
+        parts = [f" {self.nick}", window.name, f"lag {lag}"]
+        if window.scroll:
+            parts.append(f"-- rolagem (+{window.scroll}) --")
+        activity = []
+        for index, w in enumerate(self.windows.values()):
+            entry = self.activity.get(w.name)
+            if entry and entry.unread:
+                activity.append(f"{index + 1}:{w.name}({entry.unread}{'!' if entry.highlights else ''})")
+        if activity:
+            parts.append("Atividade: " + ' '.join(activity))
+        line = wrap_cells(" │ ".join(parts), width - 1)[0]
+        win.erase()
+        win.bkgd(' ', self.curses.A_REVERSE)
+        self._put(win, 0, 0, line, self.curses.A_REVERSE)
+        win.noutrefresh()
+    
+    def _draw_input(self, redraw=True):
+        win = self.input_win
+        width = win.getmaxyx()[1]
+        prompt = f"[{self.windows[self.active].name}] "
+        start = max(0, len(prompt) + self.cursor - width + 1)
+        if redraw:
+            win.erase()
+            self._put(win, 0, 0, (prompt + self.input)[start:start + width - 1])
+        try:
+            win.move(0, min(width - 1, len(prompt) + self.cursor - start))
+        except self.curses.error:
+            pass
+        win.noutrefresh()
+
+WHOIS_NUMERICS = {"301", "311", "312", "313", "317", "318", "319", "330", "338", "378", "401", "671"}
+
+class BouncerClient:
+    """Cliente IRC conectado localmente ao bouncer"""
+    
+    def __init__(self, sock, address, handshaking):
+        self.sock = sock
+        self.address = address
+        self.handshaking = handshaking
+        self.inbuf = b''
+        self.outbuf = bytearray()
+        self.nick = None
+        self.user = False
+        self.password_ok = False
+        self.registered = False
+
+class Bouncer:
+    """Compartilha a sessão upstream com vários clientes IRC locais"""
+    
+    # Linhas upstream que não fazem sentido repassar: o bouncer gera as próprias
+    PRIVATE_COMMANDS = {"CAP", "PING", "PONG", "001", "002", "003", "004", "005", "375", "372", "376", "422"}
+    
+    def __init__(self, chat, settings):
+        self.chat = chat
+        self.password = settings.get('password') or None
+        self.max_buffer = int(settings.get('max_buffer', 1024 * 1024))
+        self.clients = []
+        self.ssl_context = None
+        if settings.get('certfile'):
+            self.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.ssl_context.load_cert_chain(settings['certfile'], settings.get('keyfile') or None)
+        
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((settings.get('listen', '127.0.0.1'), int(settings.get('port', 6667))))
+        self.listener.listen(16)
+        self.listener.setblocking(False)
+    
+    def poll(self, timeout, upstream=None):
+        """Atende clientes locais; retorna quando houver atividade ou o timeout vencer"""
+        if upstream is not None and isinstance(upstream, ssl.SSLSocket) and upstream.pending():
+            timeout = 0
+        readers = [self.listener] + [c.sock for c in self.clients]
+        if upstream is not None:
+            readers.append(upstream)
+        writers = [c.sock for c in self.clients if c.outbuf or c.handshaking]
+        try:
+            readable, writable, _ = select.select(readers, writers, [], timeout)
+        except (OSError, ValueError):
+            self.clients = [c for c in self.clients if c.sock.fileno() >= 0]
+            return
+        
+        by_sock = {c.sock: c for c in self.clients}
+        for sock in readable:
+            if sock is self.listener:
+                self._accept()
+            elif sock in by_sock:
+                self._read(by_sock[sock])
+        for sock in writable:
+            client = by_sock.get(sock)
+            if client in self.clients:
+                self._flush(client)
+    
+    def _accept(self):
+        try:
+            sock, address = self.listener.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        handshaking = False
+        if self.ssl_context:
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+            handshaking = True
+        self.clients.append(BouncerClient(sock, address, handshaking))
+        self.chat.echo(f"{Colors.BLUE}🔌 Bouncer: cliente conectado de {address[0]}:{address[1]}{Colors.RESET}")
+    
+    def _drop(self, client, reason):
+        if client not in self.clients:
+            return
+        self.clients.remove(client)
+        try:
+            client.sock.close()
+        except OSError:
+            pass
+        self.chat.echo(f"{Colors.YELLOW}🔌 Bouncer: cliente {client.address[0]}:{client.address[1]} saiu ({reason}){Colors.RESET}")
+    
+    def _read(self, client):
+        try:
+            if client.handshaking:
+                client.sock.do_handshake()
+                client.handshaking = False
+                return
+            data = client.sock.recv(65536)
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError):
+            return
+        except OSError as e:
+            self._drop(client, str(e))
+            return
+        if not data:
+            self._drop(client, "conexão encerrada")
+            return
+        
+        client.inbuf += data
+        *lines, client.inbuf = client.inbuf.split(b'\n')
+        for raw in lines:
+            line = raw.decode('utf-8', errors='ignore').rstrip('\r')
+            if line.strip():
+                self._handle_client_line(client, line)
+            if client not in self.clients:
+                break
+    
+    def _handle_client_line(self, client, line):
+        msg = parse_irc_line(line)
+        command = msg['command']
+        params = msg['params']
+        
+        if command == "CAP":
+            if params and params[0].upper() == "LS":
+                self.queue(client, f":scdpi.bouncer CAP * LS :")
+            return
+        if command == "PING":
+            self.queue(client, f":scdpi.bouncer PONG scdpi.bouncer :{params[-1] if params else ''}")
+            return
+        if command == "QUIT":
+            self._drop(client, "QUIT")
+            return
+        
+        if not client.registered:
+            if command == "PASS" and params:
+                client.password_ok = params[-1] == self.password
+            elif command == "NICK" and params:
+                client.nick = params[0]
+            elif command == "USER":
+                client.user = True
+            if client.nick and client.user:
+                if self.password and not client.password_ok:
+                    self.queue(client, ":scdpi.bouncer 464 * :Senha incorreta")
+                    self._flush(client)
+                    self._drop(client, "senha incorreta")
+                    return
+                client.registered = True
+                self.replay(client)
+            return
+        
+        if command == "PRIVMSG" and len(params) >= 2:
+            # Passa pela cifragem do cliente: alvos com chave não podem sair em texto puro
+            self.chat.send_privmsg(params[0], params[-1])
+        else:
+            self.chat.send(line + "\r\n")
+        if command in ("PRIVMSG", "NOTICE") and params:
+            # O servidor não ecoa nossas mensagens: mostrar aos outros clientes anexados
+            echo = f":{self.chat.config['nickname']}!scdpi@bouncer {line}"
+            for other in self.clients:
+                if other is not client and other.registered:
+                    self.queue(other, echo)
+    
+    def replay(self, client):
+        """Registro sintético e JOIN/TOPIC/NAMES a partir do estado em cache"""
+        chat = self.chat
+        nick = chat.config['nickname']
+        server = "scdpi.bouncer"
+        network = chat.isupport.get('NETWORK') or chat.config['server']
+        self.queue(client, f":{server} 001 {nick} :Bem-vindo ao {network} via SCDPI CHAT bouncer, {nick}")
+        self.queue(client, f":{server} 002 {nick} :Servidor upstream {chat.config['server']}:{chat.config['port']}")
+        self.queue(client, f":{server} 003 {nick} :Sessão compartilhada pelo bouncer")
+        self.queue(client, f":{server} 004 {nick} {server} scdpi-chat-2.3 iosw biklmnopstv")
+        
+        tokens = [key if value == '' else f"{key}={value}" for key, value in chat.isupport.items()]
+        for start in range(0, len(tokens), 12):
+            self.queue(client, f":{server} 005 {nick} {' '.join(tokens[start:start + 12])} :são suportados por este servidor")
+        self.queue(client, f":{server} 422 {nick} :MOTD não disponível no bouncer")
+        
+        for channel in sorted(chat.joined_channels):
+            key = channel.lower()
+            if key not in chat.channel_members:
+                continue
+            self.queue(client, f":{nick}!scdpi@bouncer JOIN {channel}")
+            topic = chat.channel_topics.get(key)
+            if topic and topic.get("topic"):
+                self.queue(client, f":{server} 332 {nick} {channel} :{topic['topic']}")
+                if topic.get("setter"):
+                    self.queue(client, f":{server} 333 {nick} {channel} {topic['setter']} {topic['time']}")
+            else:
+                self.queue(client, f":{server} 331 {nick} {channel} :Sem tópico")
+            
+            names = [prefix + member for member, prefix in chat.channel_members[key].items()]
+            head = f":{server} 353 {nick} = {channel} :"
+            line = []
+            for name in names:
+                if line and len(head) + sum(len(n) + 1 for n in line) + len(name) > 480:
+                    self.queue(client, head + ' '.join(line))
+                    line = []
+                line.append(name)
+            if line:
+                self.queue(client, head + ' '.join(line))
+            self.queue(client, f":{server} 366 {nick} {channel} :Fim da lista /NAMES")
+    
+    def queue(self, client, line):
+        """Enfileira uma linha para um cliente; derruba quem estourar o buffer"""
+        client.outbuf += line.encode('utf-8') + b'\r\n'
+        if len(client.outbuf) > self.max_buffer:
+            self._drop(client, "buffer de envio cheio (cliente lento)")
+            return
+        if not client.handshaking:
+            self._flush(client)
+    
+    def _flush(self, client):
+        try:
+            if client.handshaking:
+                client.sock.do_handshake()
+                client.handshaking = False
+            while client.outbuf:
+                sent = client.sock.send(client.outbuf)
+                if not sent:
+                    break
+                del client.outbuf[:sent]
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError):
+            pass
+        except OSError as e:
+            self._drop(client, str(e))
     
-    return config
-
-def get_default_config_path():
-    """Retorna o path correto do config baseado no SO"""
-    system = platform.system()
-    if system == "Windows":
-        return Path(os.environ['APPDATA']) / "SCDPI" / "config.json"
-    elif "TERMUX" in os.environ:
-        return Path.home() / ".config" / "scdpi" / "config.json"
-    else:
-        return Path.home() / ".config" / "scdpi" / "config.json"
-
-def parse_arguments():
-    """Parse command line arguments"""
-    parser = argparse.ArgumentParser(description='SCDPI CHAT - Cliente IRC com Notificações')
-    parser.add_argument('--config', help='Arquivo de configuração personalizado')
-    parser.add_argument('--nick', help='Nickname para usar')
-    parser.add_argument('--channel', help='Canal para entrar')
-    parser.add_argument('--server', help='Servidor IRC')
-    parser.add_argument('--port', type=int, help='Porta do servidor')
-    parser.add_argument('--no-ssl', action='store_true', help='Não usar SSL')
-    parser.add_argument('--verbose', action='store_true', help='Modo detalhado')
-    parser.add_argument('--version', action='store_true', help='Mostrar versão')
-    return parser.parse_args()
+    def broadcast(self, msg, line):
+        """Repassa uma linha do upstream a todos os clientes registrados"""
+        if msg['command'] in self.PRIVATE_COMMANDS:
+            return
+        if 'scdpi/encrypted' in msg['tags']:
+            # Clientes locais recebem o texto decifrado, não o payload +SCE1
+            tags = line.split(' ', 1)[0] + ' ' if line.startswith('@') else ''
+            line = f"{tags}:{msg['prefix']} {msg['command']} {' '.join(msg['params'][:-1])} :{msg['params'][-1]}"
+        for client in list(self.clients):
+            if client.registered:
+                self.queue(client, line)
+    
+    def close(self):
+        for client in list(self.clients):
+            self._drop(client, "bouncer encerrado")
+        self.listener.close()
 
 class SCDPIChatUniversal:
     def __init__(self, args=None):
         self.args = args or parse_arguments()
+        self.config_path = None
         self.config = self.load_config()
+        try:
+            self.settings = Settings.from_config(self.config)
+        except ValueError as e:
+            self.echo(f"{Colors.RED}❌ Erro no arquivo de configuração: {e}{Colors.RESET}", level="error")
+            sys.exit(1)
+        self.config_mtime = self.read_config_mtime()
+        self.config_checked = time.monotonic()
+        self.reload_requested = False
         self.socket = None
         self.running = True
+        self.exit_status = 0
         self.current_channel = None
         self.reconnect_attempts = 0  # NOVO: Contador de tentativas de reconexão
         self.max_reconnect_attempts = 5  # NOVO: Máximo de tentativas
-        self.joined_channels = set(self.config['channels'])  # NOVO: Rastrear canais ativos
+        self.joined_channels = set(self.settings.channels)  # NOVO: Rastrear canais ativos
+        self.recv_buffer = b''
+        self.isupport = {}
+        self.channel_members = {}  # canal (minúsculo) -> {nick: prefixo de modo}
+        self.channel_topics = {}  # canal (minúsculo) -> {"topic", "setter", "time"}
+        self.floods = FloodAggregator(self.settings.flood_window, self.settings.flood_burst)
+        self.crypto = self.build_crypto(self.settings)
+        self.dcc = DccManager(self.config.get('dcc', {}), self.send_ctcp, self.echo, self.local_ip)
+        cache_settings = self.config.get('reply_cache', {})
+        self.replies = ReplyCache(cache_settings.get('ttl', 300), cache_settings.get('max_entries', 1000))
+        self.who_in_flight = deque()  # máscaras de WHO enviadas, na ordem em que o servidor responde
+        self.directory = ChannelDirectory()
+        self.pending_list = None
+        plugin_settings = self.config.get('plugins', {})
+        self.plugins = PluginManager(plugin_settings.get('directory') or get_default_config_path().parent / "plugins",
+                                     self.config, self.echo,
+                                     max_workers=plugin_settings.get('workers', 4),
+                                     timeout=plugin_settings.get('timeout', 5.0),
+                                     max_inflight=plugin_settings.get('max_inflight', 8))
+        session_settings = self.config.get('session', {})
+        self.session = SessionStore(self.config) if session_settings.get('enabled', True) else None
+        self.session_interval = session_settings.get('save_interval', 60)
+        self.session_saved = time.monotonic()
+        self.session_dirty = False
+        self.scrollback_size = session_settings.get('scrollback', 50)
+        self.scrollback = {}  # canal (minúsculo) -> últimas linhas [hora, nick, texto]
+        self.last_seen = {}  # canal (minúsculo) -> {"time": ISO 8601, "msgid": ...}
+        self.caps_wanted = {"server-time", "message-tags", "batch", "draft/chathistory", "chathistory", "away-notify"}
+        self.caps_offered = set()
+        self.caps_enabled = set()
+        self.channel_stats = {}  # canal (minúsculo) -> ChannelStats
+        self.capture = None
+        if self.args.capture:
+            self.capture = CaptureWriter(self.args.capture, self.args.capture_max_mb * 1024 * 1024,
+                                         self.args.capture_interval)
+        self.replaying = False
+        self.bouncer = None
+        self.ping_sent = time.monotonic()
+        self.lag = None
+        self.jsonl = None
+        if self.args.output == 'jsonl':
+            self.jsonl = JsonlWriter(max_queue=self.args.jsonl_queue,
+                                     policy=self.args.jsonl_backpressure)
+        self.activity = ActivityTracker()
+        self.tui = None
+        if getattr(self.args, 'tui', False) and not self.jsonl:
+            tui_settings = self.config.get('tui', {})
+            try:
+                self.tui = TerminalUI(self.activity, on_switch=self.window_changed,
+                                      max_fps=tui_settings.get('max_fps', 20),
+                                      scrollback=tui_settings.get('scrollback', 1000))
+            except ImportError:
+                self.echo(f"{Colors.RED}❌ Módulo curses indisponível (no Windows: pip install windows-curses){Colors.RESET}",
+                          level="error")
+    
+    def echo(self, text="", window=None, activity=None, level=None):
+        """Exibe texto para o usuário; no modo JSON lines só avisos e erros (level), em stderr"""
+        if getattr(self.args, 'output', 'text') == 'jsonl':
+            # stdout é só de eventos; avisos e erros ainda precisam chegar a quem roda o cliente
+            if level in ("warning", "error"):
+                print(ANSI_SGR.sub('', text).strip(), file=sys.stderr)
+            return
+        if getattr(self, 'tui', None) and self.tui.screen is not None:
+            # Sem janela explícita a linha vai para a janela ativa
+            self.tui.add_line(window, text, activity)
+            return
+        print(text)
+    
+    def window_changed(self, target):
+        """A janela ativa mudou: ela passa a ser o destino do que for digitado"""
+        self.current_channel = target
+        if target:
+            self.activity.mark_read(target)
+    
+    def activate(self, target):
+        """Torna o canal/query a janela ativa; no modo texto mostra o que não foi lido"""
+        entry = self.activity.get(target)
+        pending = entry.unread if entry else 0
+        if self.tui:
+            self.tui.switch(target)
+            return
+        self.window_changed(target)
+        if not target:
+            return
+        if pending:
+            self.echo(f"{Colors.BOLD}{Colors.CYAN}── {pending} não lidas em {target} ──{Colors.RESET}")
+            lines = list(self.scrollback.get(target.lower(), ()))
+            for seen, nick, text in lines[-pending:]:
+                self.echo(f"{Colors.CYAN}[{local_clock(seen)}] <{nick}> {Colors.WHITE}{text}{Colors.RESET}")
+        else:
+            self.echo(f"{Colors.CYAN}➡️ Janela ativa: {target}{Colors.RESET}")
+    
+    def close_tui(self):
+        """Restaura o terminal; mensagens seguintes voltam a ser impressas"""
+        if self.tui:
+            self.tui.stop()
+            self.tui = None
 
     def load_config(self):
         """Carrega configuração com fallback para interativa"""
@@ -126,9 +2345,11 @@ class SCDPIChatUniversal:
             if config_path.exists():
                 try:
                     with open(config_path, 'r', encoding='utf-8') as f:
-                        return json.load(f)
+                        config = json.load(f)
+                    self.config_path = config_path
+                    return config
                 except (json.JSONDecodeError, IOError) as e:
-                    print(f"{Colors.RED}❌ Erro no arquivo de configuração: {e}{Colors.RESET}")
+                    self.echo(f"{Colors.RED}❌ Erro no arquivo de configuração: {e}{Colors.RESET}", level="error")
                     sys.exit(1)
         
         # Tenta carregar configuração padrão
@@ -136,16 +2357,141 @@ class SCDPIChatUniversal:
         if config_path.exists():
             try:
                 with open(config_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    config = json.load(f)
+                self.config_path = config_path
+                return config
             except (json.JSONDecodeError, IOError):
-                print(f"{Colors.YELLOW}⚠️ Configuração padrão não encontrada, criando nova...{Colors.RESET}")
+                self.echo(f"{Colors.YELLOW}⚠️ Configuração padrão não encontrada, criando nova...{Colors.RESET}",
+                          level="warning")
         
         # Se --nick foi fornecido, usar ele
         if self.args.nick:
             return self.create_minimal_config(self.args.nick)
         
         # Modo interativo
-        return get_user_configuration()
+        config = get_user_configuration()
+        self.config_path = get_default_config_path()
+        return config
+    
+    def build_crypto(self, settings):
+        """Cria o ChannelCrypto a partir da configuração (None se desativado)"""
+        if not settings.encrypted:
+            return None
+        try:
+            crypto = ChannelCrypto(settings.encryption.get('passphrase'), settings.encryption.get('keys'))
+        except RuntimeError as e:
+            self.echo(f"{Colors.RED}❌ Criptografia desativada: {e}{Colors.RESET}", level="error")
+            return None
+        for target, secret in (settings.encryption.get('keys') or {}).items():
+            if secret.startswith("base64:"):
+                try:
+                    crypto._cipher(target)
+                except ValueError as e:
+                    crypto.remove_key(target)
+                    self.echo(f"{Colors.RED}❌ Criptografia desativada para {target}: {e}{Colors.RESET}", level="error")
+        return crypto
+    
+    def read_config_mtime(self):
+        try:
+            return self.config_path.stat().st_mtime_ns if self.config_path else None
+        except OSError:
+            return None
+    
+    def check_config_reload(self):
+        """Recarrega se houve SIGHUP ou se o mtime do arquivo mudou (verificado a cada poucos segundos)"""
+        if self.reload_requested:
+            self.reload_requested = False
+            self.reload_config()
+            return
+        now = time.monotonic()
+        if self.config_path is None or now - self.config_checked < self.config.get('config_check_interval', 2.0):
+            return
+        self.config_checked = now
+        mtime = self.read_config_mtime()
+        if mtime is not None and mtime != self.config_mtime:
+            self.reload_config()
+    
+    def reload_config(self):
+        """Valida o arquivo novamente e aplica apenas as diferenças"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        if self.config_path is None:
+            self.echo(f"{Colors.YELLOW}[{timestamp}] ⚠️ Configuração não veio de arquivo; nada a recarregar{Colors.RESET}",
+                      level="warning")
+            return
+        self.config_mtime = self.read_config_mtime()
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            settings = Settings.from_config(config)
+        except (json.JSONDecodeError, IOError, ValueError) as e:
+            self.echo(f"{Colors.RED}[{timestamp}] ❌ Configuração inválida, mantendo a atual: {e}{Colors.RESET}",
+                      level="error")
+            return
+        
+        old = self.settings
+        runtime_nick = self.config['nickname']
+        self.config = config
+        self.settings = settings
+        self.plugins.config = config
+        changes = []
+        
+        if settings.connection() != old.connection():
+            self.echo(f"{Colors.YELLOW}[{timestamp}] 🔄 Servidor/porta/TLS mudaram: reconectando...{Colors.RESET}")
+            if self.socket:
+                try:
+                    self.send("QUIT :Reconectando (configuração alterada)\r\n")
+                    self.socket.close()
+                except OSError:
+                    pass
+            self.joined_channels = set(settings.channels)
+            self.channel_members.clear()
+            self.channel_topics.clear()
+            self.isupport.clear()
+            if not self.connect():
+                self.reconnect()
+            return
+        
+        if settings.nickname != old.nickname:
+            self.send(f"NICK {settings.nickname}\r\n")
+            changes.append(f"nick {settings.nickname}")
+        else:
+            # Manter o nick em uso (pode ter sido trocado após 433 ou /nick)
+            self.config['nickname'] = runtime_nick
+            settings.compile_highlights(runtime_nick)
+        
+        old_channels = {c.lower() for c in old.channels}
+        new_channels = {c.lower() for c in settings.channels}
+        for channel in settings.channels:
+            if channel.lower() not in old_channels:
+                self.send(f"JOIN {channel}\r\n")
+                self.joined_channels.add(channel)
+                changes.append(f"+{channel}")
+        for channel in old.channels:
+            if channel.lower() not in new_channels:
+                self.send(f"PART {channel}\r\n")
+                changes.append(f"-{channel}")
+        
+        if (settings.highlight_words, settings.notify_mentions, settings.notify_private) != \
+                (old.highlight_words, old.notify_mentions, old.notify_private):
+            changes.append("destaques/notificações")
+        if (settings.flood_window, settings.flood_burst) != (old.flood_window, old.flood_burst):
+            self.floods.window, self.floods.burst = settings.flood_window, settings.flood_burst
+            changes.append("agregação de rajadas")
+        if (settings.encrypted, settings.encryption) != (old.encrypted, old.encryption):
+            self.crypto = self.build_crypto(settings)
+            changes.append("criptografia")
+        if settings.reply_cache != old.reply_cache:
+            self.replies.ttl = settings.reply_cache.get('ttl', 300)
+            self.replies.max_entries = settings.reply_cache.get('max_entries', 1000)
+            changes.append("cache de respostas")
+        if settings.dcc != old.dcc:
+            self.dcc.transfer_rate = int(settings.dcc.get('transfer_rate', 0))
+            self.dcc.global_bucket.rate = int(settings.dcc.get('max_rate', 0))
+            self.dcc.auto_accept = settings.dcc.get('auto_accept', False)
+            changes.append("DCC")
+        
+        summary = ", ".join(changes) if changes else "sem mudanças aplicáveis"
+        self.echo(f"{Colors.GREEN}[{timestamp}] 🔁 Configuração recarregada: {summary}{Colors.RESET}")
     
     def create_minimal_config(self, nickname):
         """Cria configuração mínima com nickname"""
@@ -161,21 +2507,21 @@ class SCDPIChatUniversal:
     
     def print_banner(self):
         """Exibe banner centralizado"""
-        terminal_width = os.get_terminal_size().columns
+        terminal_width = shutil.get_terminal_size().columns
         padding = (terminal_width - 50) // 2
         
-        print(f"{Colors.BOLD}{Colors.CYAN}")
-        print(" " * padding + "╔══════════════════════════════════════════╗")
-        print(" " * padding + "║           SCDPI CHAT v2.3                ║")
-        print(" " * padding + "║      Cliente IRC Multiplataforma         ║")
-        print(" " * padding + "╚══════════════════════════════════════════╝")
-        print(f"{Colors.RESET}")
+        self.echo(f"{Colors.BOLD}{Colors.CYAN}")
+        self.echo(" " * padding + "╔══════════════════════════════════════════╗")
+        self.echo(" " * padding + "║           SCDPI CHAT v2.3                ║")
+        self.echo(" " * padding + "║      Cliente IRC Multiplataforma         ║")
+        self.echo(" " * padding + "╚══════════════════════════════════════════╝")
+        self.echo(f"{Colors.RESET}")
         
-        print(f"{Colors.YELLOW}📡 Conectando: {self.config['server']}:{self.config['port']}")
-        print(f"👤 Nickname: {self.config['nickname']}")
-        print(f"📺 Canais: {', '.join(self.config['channels'])}")
-        print(f"💡 Comandos: /help para ajuda{Colors.RESET}")
-        print("─" * terminal_width)
+        self.echo(f"{Colors.YELLOW}📡 Conectando: {self.config['server']}:{self.config['port']}")
+        self.echo(f"👤 Nickname: {self.config['nickname']}")
+        self.echo(f"📺 Canais: {', '.join(self.config['channels'])}")
+        self.echo(f"💡 Comandos: /help para ajuda{Colors.RESET}")
+        self.echo("─" * terminal_width)
     
     def clear_screen(self):
         """Limpa a tela de forma multiplataforma"""
@@ -191,53 +2537,508 @@ class SCDPIChatUniversal:
             sock.settimeout(10.0)
             
             if self.config.get('use_ssl', True):
-                context = ssl.create_default_context()
-                context.check_hostname = False
-                context.verify_mode = ssl.CERT_NONE
+                context = create_ssl_context()
                 self.socket = context.wrap_socket(sock, server_hostname=self.config['server'])
             else:
                 self.socket = sock
-                print(f"{Colors.YELLOW}⚠️  Conexão não criptografada!{Colors.RESET}")
+                self.echo(f"{Colors.YELLOW}⚠️  Conexão não criptografada!{Colors.RESET}", level="warning")
             
-            print(f"{Colors.BLUE}🔗 Conectando a {self.config['server']}:{self.config['port']}...{Colors.RESET}")
+            self.echo(f"{Colors.BLUE}🔗 Conectando a {self.config['server']}:{self.config['port']}...{Colors.RESET}")
             self.socket.connect((self.config['server'], self.config['port']))
+            self.recv_buffer = b''
+            self.caps_offered.clear()
+            self.caps_enabled.clear()
+            self.who_in_flight.clear()
             
-            if self.config.get('server_password'):
-                self.send(f"PASS {self.config['server_password']}\r\n")
-            
-            self.send(f"USER {self.config['nickname']} 0 * :{self.config['realname']}\r\n")
-            self.send(f"NICK {self.config['nickname']}\r\n")
+            self.send("CAP LS 302\r\n")
+            for line in registration_lines(self.config, self.config['nickname']):
+                self.send(line)
             
-            print(f"{Colors.GREEN}✅ Conectado! Digite /help para ajuda{Colors.RESET}")
+            self.echo(f"{Colors.GREEN}✅ Conectado! Digite /help para ajuda{Colors.RESET}")
             self.reconnect_attempts = 0  # NOVO: Resetar contador de reconexão
+            self.plugins.dispatch("connect", {"server": self.config['server'], "port": self.config['port'],
+                                              "nick": self.config['nickname']})
             return True
             
         except Exception as e:
-            print(f"{Colors.RED}❌ Erro de conexão: {e}{Colors.RESET}")
+            self.echo(f"{Colors.RED}❌ Erro de conexão: {e}{Colors.RESET}", level="error")
             return False
     
     def send(self, message):
         """Envia mensagem para o servidor"""
+        if self.replaying:
+            return
         try:
-            self.socket.send(message.encode('utf-8'))
+            data = message.encode('utf-8')
+            self.socket.send(data)
+            if self.capture:
+                self.capture.record('>', data)
+            self.plugins.dispatch("send", message.rstrip("\r\n"))
             if self.args.verbose:
-                print(f"{Colors.YELLOW}📤 Enviado: {message.strip()}{Colors.RESET}")
+                self.echo(f"{Colors.YELLOW}📤 Enviado: {message.strip()}{Colors.RESET}")
         except Exception as e:
-            print(f"{Colors.RED}❌ Erro ao enviar: {e}{Colors.RESET}")
+            self.echo(f"{Colors.RED}❌ Erro ao enviar: {e}{Colors.RESET}", level="error")
             self.running = False
     
-    def receive(self):
-        """Recebe dados do servidor"""
+    def receive(self, timeout=0.5):
+        """Recebe dados do servidor e retorna apenas linhas completas"""
         try:
-            self.socket.settimeout(0.5)
-            data = self.socket.recv(4096).decode('utf-8', errors='ignore').strip()
-            return data
+            self.socket.settimeout(timeout)
+            chunk = self.socket.recv(65536)
         except socket.timeout:
             return None
-        except Exception as e:
-            print(f"{Colors.RED}❌ Erro ao receber: {e}{Colors.RESET}")
-            return None
-
+        if not chunk:
+            raise ConnectionResetError("conexão fechada pelo servidor")
+        if self.capture:
+            self.capture.record('<', chunk)
+        return self.split_lines(chunk)
+    
+    def split_lines(self, chunk):
+        """Acrescenta bytes ao buffer e retorna as linhas completas"""
+        self.recv_buffer += chunk
+        # Uma linha (ou um caractere UTF-8) pode chegar dividida entre dois recv: guardar o resto
+        *lines, self.recv_buffer = self.recv_buffer.split(b'\n')
+        decoded = (line.decode('utf-8', errors='ignore').rstrip('\r') for line in lines)
+        return [line for line in decoded if line.strip()]
+    
+    def update_isupport(self, msg):
+        """Registra os tokens RPL_ISUPPORT (005) anunciados pelo servidor"""
+        for token in msg['params'][1:-1]:
+            key, _, value = token.partition('=')
+            if key.startswith('-'):
+                self.isupport.pop(key[1:], None)
+            else:
+                self.isupport[key] = value
+    
+    def member_prefixes(self):
+        """Símbolos de modo (@, +, ...) que precedem nicks no NAMES"""
+        prefix = self.isupport.get('PREFIX', '(ov)@+')
+        return prefix.split(')', 1)[1] if ')' in prefix else '@+'
+    
+    def handle_whois_reply(self, command, params):
+        """Monta as várias linhas numéricas de um WHOIS em um único registro"""
+        nick = params[1]
+        # 401 de um PRIVMSG ou 301 de um usuário ausente não são respostas a um WHOIS nosso
+        if not self.replies.is_pending("whois", nick):
+            return
+        if command == "318":
+            self.replies.complete("whois", nick)
+            return
+        record = self.replies.record("whois", nick, lambda: {
+            "nick": nick, "user": None, "host": None, "realname": None, "server": None,
+            "server_info": None, "channels": [], "idle": None, "signon": None, "away": None,
+            "account": None, "operator": False, "secure": False, "error": None,
+        })
+        text = params[-1]
+        if command == "311" and len(params) >= 6:
+            record.update(nick=nick, user=params[2], host=params[3], realname=text)
+        elif command == "312" and len(params) >= 3:
+            record.update(server=params[2], server_info=text)
+        elif command == "313":
+            record["operator"] = True
+        elif command == "317" and len(params) >= 4:
+            record["idle"] = int(params[2]) if params[2].isdigit() else None
+            record["signon"] = int(params[3]) if params[3].isdigit() else None
+        elif command == "319":
+            record["channels"].extend(text.split())
+        elif command == "301":
+            record["away"] = text
+        elif command == "330" and len(params) >= 3:
+            record["account"] = params[2]
+        elif command == "671":
+            record["secure"] = True
+        elif command == "401":
+            record["error"] = text
+    
+    def handle_who_reply(self, command, params):
+        """Acumula linhas 352 sob a máscara em andamento até o 315 que a encerra"""
+        if command == "315":
+            mask = params[1]
+            for pending in list(self.who_in_flight):
+                if pending.lower() == mask.lower():
+                    self.who_in_flight.remove(pending)
+                    break
+            self.replies.complete("who", mask)
+            return
+        # O 352 traz o canal do usuário (ou *), não a máscara pedida
+        if len(params) < 8 or not self.who_in_flight:
+            return
+        mask = self.who_in_flight[0]
+        record = self.replies.record("who", mask, lambda: {"mask": mask, "users": []})
+        hops, _, realname = params[7].partition(' ')
+        record["users"].append({
+            "nick": params[5], "user": params[2], "host": params[3],
+            "server": params[4], "flags": params[6], "realname": realname,
+        })
+    
+    def lookup(self, kind, key, callback=None):
+        """Consulta WHOIS/WHO/NAMES pelo cache; consultas simultâneas viram um só pedido"""
+        request = {"whois": f"WHOIS {key}", "who": f"WHO {key}", "names": f"NAMES {key}"}[kind]
+        
+        def send():
+            if kind == "who":
+                self.who_in_flight.append(key)
+            self.send(request + "\r\n")
+        return self.replies.request(kind, key, callback, send)
+    
+    def show_reply(self, kind, record, cached):
+        """Exibe um registro do cache de respostas"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        source = " (cache)" if cached else ""
+        if kind == "whois":
+            if record["error"]:
+                self.echo(f"{Colors.RED}[{timestamp}] ❌ {record['nick']}: {record['error']}{Colors.RESET}",
+                          level="error")
+                return
+            self.echo(f"{Colors.BOLD}{Colors.CYAN}[{timestamp}] 👤 {record['nick']} ({record['user']}@{record['host']}){source}{Colors.RESET}")
+            self.echo(f"{Colors.WHITE}   Nome: {record['realname']}")
+            self.echo(f"   Servidor: {record['server']} ({record['server_info']})")
+            if record["account"]:
+                self.echo(f"   Conta: {record['account']}")
+            if record["channels"]:
+                self.echo(f"   Canais: {' '.join(record['channels'])}")
+            if record["idle"] is not None:
+                self.echo(f"   Ocioso: {record['idle']}s")
+            if record["away"]:
+                self.echo(f"   Ausente: {record['away']}")
+            if record["operator"]:
+                self.echo("   IRC operator")
+            self.echo(f"{Colors.RESET}")
+        elif kind == "who":
+            self.echo(f"{Colors.BOLD}{Colors.CYAN}[{timestamp}] 👥 WHO {record['mask']}: {len(record['users'])} usuários{source}{Colors.RESET}")
+            for user in record["users"]:
+                self.echo(f"{Colors.WHITE}   {user['nick']} ({user['user']}@{user['host']}) [{user['flags']}] {user['realname']}{Colors.RESET}")
+        else:
+            names = sorted(prefix + nick for nick, prefix in record["names"].items())
+            self.echo(f"{Colors.BOLD}{Colors.CYAN}[{timestamp}] 👥 {record['channel']} ({len(names)} usuários){source}:{Colors.RESET}")
+            self.echo(f"{Colors.WHITE}   {' '.join(names)}{Colors.RESET}")
+    
+    def parse_list_args(self, args):
+        """Interpreta /list [--min N] [--max N] [--match texto] [--topic texto] [--sort users|name|topic] [--page N] [--refresh]"""
+        query = {"min_users": 0, "max_users": None, "match": None, "topic": None,
+                 "sort": "users", "page": 1, "refresh": False}
+        tokens = args.split()
+        options = {"--min": ("min_users", int), "--max": ("max_users", int), "--match": ("match", str),
+                   "--topic": ("topic", str), "--sort": ("sort", str), "--page": ("page", int)}
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token == "--refresh":
+                query["refresh"] = True
+            elif token in options and i + 1 < len(tokens):
+                key, convert = options[token]
+                query[key] = convert(tokens[i + 1])
+                i += 1
+            elif not token.startswith("--") and query["match"] is None:
+                query["match"] = token
+            else:
+                raise ValueError(token)
+            i += 1
+        if query["sort"] not in ("users", "name", "topic"):
+            raise ValueError(query["sort"])
+        query["page"] = max(1, query["page"])
+        return query
+    
+    def list_channels(self, args):
+        """/list: usa o índice local se ainda válido, senão pede ao servidor com filtros ELIST"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        try:
+            query = self.parse_list_args(args)
+        except ValueError as e:
+            self.echo(f"{Colors.RED}[{timestamp}] ❌ Opção inválida: {e}. Uso: /list [--min N] [--max N] "
+                      f"[--match texto] [--topic texto] [--sort users|name|topic] [--page N] [--refresh]{Colors.RESET}",
+                      level="error")
+            return
+        
+        # Filtros que o servidor consegue aplicar (ELIST U = contagem, M = máscara)
+        elist = self.isupport.get('ELIST', '').upper()
+        server_min = query["min_users"] if 'U' in elist and query["min_users"] > 0 else 0
+        server_mask = None
+        if 'M' in elist and query["match"]:
+            server_mask = query["match"] if any(c in query["match"] for c in '*?') else f"*{query['match']}*"
+        server_filter = (server_min, server_mask) if server_min or server_mask else None
+        
+        if not query["refresh"] and self.directory.covers(server_filter, self.config.get('list_cache_ttl', 600)):
+            self.show_list(query, cached=True)
+            return
+        if self.pending_list and self.directory.collecting:
+            if self.directory.filter_covers(self.directory.server_filter, server_filter):
+                self.pending_list = query
+            else:
+                self.echo(f"{Colors.YELLOW}[{timestamp}] ⏳ Aguarde o /list em andamento terminar{Colors.RESET}")
+            return
+        
+        conditions = ([server_mask] if server_mask else []) + ([f">{server_min - 1}"] if server_min else [])
+        self.directory.begin(server_filter)
+        self.pending_list = query
+        self.send(f"LIST {','.join(conditions)}\r\n" if conditions else "LIST\r\n")
+        self.echo(f"{Colors.BLUE}[{timestamp}] 📜 Baixando lista de canais...{Colors.RESET}")
+    
+    def show_list(self, query, cached):
+        """Exibe uma página do índice de canais"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        page_size = 50
+        total, rows = self.directory.query(query["min_users"], query["max_users"], query["match"],
+                                           query["topic"], query["sort"], query["page"], page_size)
+        pages = max(1, (total + page_size - 1) // page_size)
+        source = " (cache)" if cached else ""
+        self.echo(f"{Colors.BOLD}{Colors.CYAN}[{timestamp}] 📜 {total} de {len(self.directory)} canais - "
+                  f"página {query['page']}/{pages}{source}{Colors.RESET}")
+        for name, users, topic in rows:
+            self.echo(f"{Colors.YELLOW}{name:<30}{Colors.GREEN}{users:>7}  {Colors.WHITE}{topic[:80]}{Colors.RESET}")
+    
+    def update_channel_stats(self, channel, nick, text, timestamp):
+        """Alimenta as estatísticas de streaming do canal e avisa sobre picos"""
+        key = channel.lower()
+        stats = self.channel_stats.get(key)
+        if stats is None:
+            stats = self.channel_stats[key] = ChannelStats()
+        now = time.monotonic()
+        stats.add(nick, text, now)
+        spike = stats.spike(now)
+        if spike:
+            self.echo(f"{Colors.BOLD}{Colors.YELLOW}[{timestamp}] 📈 Pico de atividade em {channel}: "
+                      f"{spike[0]:.0f} msg/min (normal {spike[1]:.1f}){Colors.RESET}", window=channel)
+    
+    def show_top(self, channel, timestamp):
+        """/top: quem mais fala, URLs e palavras mais citadas"""
+        stats = self.channel_stats.get(channel.lower())
+        if stats is None:
+            self.echo(f"{Colors.YELLOW}[{timestamp}] Sem mensagens contabilizadas em {channel}{Colors.RESET}")
+            return
+        self.echo(f"{Colors.BOLD}{Colors.CYAN}[{timestamp}] 🏆 {channel}: {stats.messages} mensagens{Colors.RESET}")
+        for title, counter in (("Quem mais fala", stats.talkers), ("URLs", stats.urls), ("Palavras", stats.keywords)):
+            ranked = counter.top(5)
+            if ranked:
+                items = ", ".join(f"{item} ({count}{'~' if error else ''})" for item, count, error in ranked)
+                self.echo(f"{Colors.WHITE}   {title}: {items}{Colors.RESET}")
+    
+    def show_rates(self, channel, timestamp):
+        """/rate: mensagens por minuto (recente e média de 15 min)"""
+        now = time.monotonic()
+        if channel:
+            keys = [channel.lower()]
+        else:
+            keys = sorted(self.channel_stats, key=lambda key: -self.channel_stats[key].short.per_minute(now))
+        if not any(key in self.channel_stats for key in keys):
+            self.echo(f"{Colors.YELLOW}[{timestamp}] Sem mensagens contabilizadas{Colors.RESET}")
+            return
+        for key in keys:
+            stats = self.channel_stats.get(key)
+            if stats:
+                self.echo(f"{Colors.CYAN}[{timestamp}] 📊 {key}: {stats.short.per_minute(now):.1f} msg/min agora, "
+                          f"{stats.long.per_minute(now):.1f} msg/min (15 min), {stats.messages} no total{Colors.RESET}")
+    
+    def handle_cap(self, params):
+        """Negociação IRCv3: pede server-time, chathistory etc. quando oferecidos"""
+        subcommand = params[1].upper()
+        if subcommand == "LS":
+            self.caps_offered.update(cap.split('=', 1)[0] for cap in params[-1].split())
+            if params[2] == '*' and len(params) > 3:
+                return  # LS em várias linhas: esperar a última
+            wanted = sorted(self.caps_wanted & self.caps_offered)
+            if wanted:
+                self.send(f"CAP REQ :{' '.join(wanted)}\r\n")
+            else:
+                self.send("CAP END\r\n")
+        elif subcommand == "ACK":
+            self.caps_enabled.update(cap.lstrip('-') for cap in params[-1].split() if not cap.startswith('-'))
+            self.send("CAP END\r\n")
+        elif subcommand == "NAK":
+            self.send("CAP END\r\n")
+    
+    def record_message(self, channel, nick, text, tags=None):
+        """Guarda a linha no scrollback e marca a última mensagem vista no canal"""
+        key = channel.lower()
+        tags = tags or {}
+        seen = tags.get('time') or datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+        lines = self.scrollback.get(key)
+        if lines is None:
+            lines = self.scrollback[key] = deque(maxlen=self.scrollback_size)
+        elif tags.get('msgid') and self.last_seen.get(key, {}).get('msgid') == tags['msgid']:
+            return False  # repetida pelo CHATHISTORY
+        lines.append([seen, nick, text])
+        self.last_seen[key] = {"time": seen, "msgid": tags.get('msgid')}
+        self.session_dirty = True
+        return True
+    
+    def snapshot(self):
+        """Estado atual serializável da sessão"""
+        channels = {}
+        for channel in self.joined_channels:
+            key = channel.lower()
+            channels[channel] = {
+                "topic": self.channel_topics.get(key),
+                "members": self.channel_members.get(key, {}),
+                "last_seen": self.last_seen.get(key),
+                "scrollback": list(self.scrollback.get(key, ())),
+            }
+        return {
+            "saved_at": int(time.time()),
+            "nick": self.config['nickname'],
+            "current_channel": self.current_channel,
+            "channels": channels,
+        }
+    
+    def save_session(self, force=False):
+        """Salva o snapshot no encerramento ou periodicamente se algo mudou"""
+        if not self.session:
+            return
+        now = time.monotonic()
+        if not force and (not self.session_dirty or now - self.session_saved < self.session_interval):
+            return
+        try:
+            self.session.save(self.snapshot())
+            self.session_dirty = False
+        except OSError as e:
+            self.echo(f"{Colors.RED}❌ Não foi possível salvar a sessão: {e}{Colors.RESET}", level="error")
+        self.session_saved = now
+    
+    def restore_session(self):
+        """Carrega o último snapshot e exibe o estado anterior imediatamente"""
+        data = self.session.load() if self.session else None
+        if not data:
+            return False
+        
+        for channel, state in data.get("channels", {}).items():
+            key = channel.lower()
+            self.joined_channels.add(channel)
+            if state.get("topic"):
+                self.channel_topics[key] = state["topic"]
+            self.channel_members[key] = dict(state.get("members") or {})
+            if state.get("last_seen"):
+                self.last_seen[key] = state["last_seen"]
+            self.scrollback[key] = deque((list(line) for line in state.get("scrollback", [])),
+                                         maxlen=self.scrollback_size)
+        if data.get("current_channel") in self.joined_channels:
+            self.activate(data["current_channel"])
+        
+        saved = datetime.fromtimestamp(data.get("saved_at", 0)).strftime("%d/%m %H:%M")
+        self.echo(f"{Colors.BOLD}{Colors.BLUE}♻️ Sessão restaurada ({saved}){Colors.RESET}")
+        for channel in sorted(data.get("channels", {})):
+            key = channel.lower()
+            topic = (self.channel_topics.get(key) or {}).get("topic", "")
+            self.echo(f"{Colors.BOLD}{Colors.CYAN}── {channel} ({len(self.channel_members.get(key, {}))} usuários) {topic[:60]}{Colors.RESET}",
+                      window=channel)
+            for seen, nick, text in self.scrollback.get(key, ()):
+                self.echo(f"{Colors.CYAN}[{local_clock(seen)}] <{nick}> {Colors.WHITE}{text}{Colors.RESET}", window=channel)
+        return True
+    
+    def fetch_history(self, channel):
+        """Após entrar no canal, pede só as mensagens posteriores à última vista (CHATHISTORY)"""
+        seen = self.last_seen.get(channel.lower())
+        if not seen or 'CHATHISTORY' not in self.isupport:
+            return
+        if not {"draft/chathistory", "chathistory"} & self.caps_enabled:
+            return
+        limit = self.isupport.get('CHATHISTORY') or '100'
+        limit = min(int(limit), 100) if limit.isdigit() and int(limit) > 0 else 100
+        reference = f"msgid={seen['msgid']}" if seen.get('msgid') else f"timestamp={seen['time']}"
+        self.send(f"CHATHISTORY AFTER {channel} {reference} {limit}\r\n")
+    
+    def apply_channel_modes(self, channel, modes, args):
+        """Atualiza os prefixos (@, +, ...) dos membros a partir de um MODE de canal"""
+        prefix = self.isupport.get('PREFIX', '(ov)@+')
+        letters, _, symbols = prefix[1:].partition(')')
+        chanmodes = (self.isupport.get('CHANMODES', 'beI,k,l,imnpst').split(',') + ['', '', ''])[:3]
+        members = self.channel_members.get(channel.lower(), {})
+        args = list(args)
+        adding = True
+        for mode in modes:
+            if mode in '+-':
+                adding = mode == '+'
+            elif mode in letters:
+                nick = args.pop(0) if args else None
+                if nick not in members:
+                    continue
+                symbol = symbols[letters.index(mode)]
+                current = members[nick].replace(symbol, '')
+                if adding:
+                    current += symbol
+                # Manter a ordem de precedência anunciada pelo servidor
+                members[nick] = ''.join(s for s in symbols if s in current)
+            elif mode in chanmodes[0] or mode in chanmodes[1] or (adding and mode in chanmodes[2]):
+                if args:
+                    args.pop(0)
+    
+    def flush_floods(self, force=False):
+        """Exibe os resumos de rajadas cuja janela terminou"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        for channel, summary in self.floods.flush(force=force):
+            self.echo(f"{Colors.BLUE}[{timestamp}] ⇅ {channel}: {summary}{Colors.RESET}", window=channel)
+    
+    def build_event(self, msg):
+        """Monta o evento estruturado emitido no modo JSON lines"""
+        params = msg['params']
+        channel = None
+        for param in params[:-1] if msg['trailing'] is not None else params:
+            if param[:1] in '#&+!':
+                channel = param
+                break
+        if channel is None and msg['command'] == 'JOIN' and params:
+            channel = params[0]
+        
+        return {
+            "type": msg['command'].lower(),
+            "time": msg['tags'].get('time') or datetime.now().astimezone().isoformat(timespec='milliseconds'),
+            "network": self.isupport.get('NETWORK') or self.config.get('server'),
+            "channel": channel,
+            "nick": msg['nick'] or None,
+            "text": msg['trailing'],
+            "tags": msg['tags'],
+        }
+    
+    def decrypt_message(self, msg):
+        """Substitui o payload cifrado de um PRIVMSG pelo texto decifrado"""
+        target = msg['params'][0]
+        if target == self.config['nickname']:
+            target = msg['nick']
+        if not self.crypto or not self.crypto.has_key(target):
+            return
+        try:
+            text = self.crypto.decrypt(target, msg['params'][-1])
+            msg['tags']['scdpi/encrypted'] = ''
+        except ValueError:
+            text = "[mensagem cifrada ilegível]"
+        msg['params'][-1] = msg['trailing'] = text
+    
+    def local_ip(self):
+        """Endereço local da conexão IRC, anunciado nas ofertas DCC"""
+        try:
+            return self.socket.getsockname()[0]
+        except (AttributeError, OSError):
+            return "127.0.0.1"
+    
+    def send_ctcp(self, target, text):
+        """Envia uma requisição CTCP"""
+        self.send(f"PRIVMSG {target} :\x01{text}\x01\r\n")
+    
+    def handle_ctcp(self, sender, target, text, timestamp):
+        """Processa CTCP (ACTION, VERSION, PING e DCC) recebido em um PRIVMSG"""
+        ctcp, _, args = text.strip('\x01').partition(' ')
+        ctcp = ctcp.upper()
+        if ctcp == "ACTION":
+            conversation = sender if target == self.config['nickname'] else target
+            self.activity.add(conversation, active=conversation.lower() == (self.current_channel or '').lower())
+            self.echo(f"{Colors.CYAN}[{timestamp}] * {sender}@{target} {Colors.WHITE}{args}{Colors.RESET}",
+                      window=conversation, activity="message")
+        elif ctcp == "DCC":
+            self.dcc.handle_ctcp(sender, args)
+        elif ctcp == "VERSION":
+            self.send(f"NOTICE {sender} :\x01VERSION SCDPI CHAT v2.3\x01\r\n")
+        elif ctcp == "PING":
+            self.send(f"NOTICE {sender} :\x01PING {args}\x01\r\n")
+        elif self.args.verbose:
+            self.echo(f"{Colors.YELLOW}⚡ [{timestamp}] CTCP {ctcp} de {sender}{Colors.RESET}")
+    
+    def send_privmsg(self, target, text):
+        """Envia PRIVMSG, cifrando e dividindo em várias linhas se houver chave para o alvo"""
+        if self.crypto and self.crypto.has_key(target):
+            for payload in self.crypto.encrypt(target, text):
+                self.send(f"PRIVMSG {target} :{payload}\r\n")
+        else:
+            self.send(f"PRIVMSG {target} :{text}\r\n")
+    
     def handle_message(self, data):
         """Processa mensagens do servidor"""
         if not data:
@@ -245,71 +3046,210 @@ class SCDPIChatUniversal:
         
         # Adicionar timestamp
         timestamp = datetime.now().strftime("%H:%M:%S")
+        msg = parse_irc_line(data)
+        command = msg['command']
+        params = msg['params']
+        
+        if command == "PRIVMSG" and len(params) > 1 and params[-1].startswith(ChannelCrypto.MARKER):
+            self.decrypt_message(msg)
+        
+        if self.jsonl:
+            self.jsonl.emit(self.build_event(msg))
+        if self.bouncer:
+            self.bouncer.broadcast(msg, data)
+        if command in self.plugins.handlers or "*" in self.plugins.handlers or not self.plugins.loaded:
+            self.plugins.dispatch(command, dict(msg, params=list(params), raw=data))
         
         # ✅✅✅ CORREÇÃO CRÍTICA - RESPONDER PING IMEDIATAMENTE!
-        if data.startswith("PING"):
-            pong_response = data.replace("PING", "PONG")
-            self.send(pong_response)
+        if command == "PING":
+            pong_response = "PONG" + data[data.index("PING") + 4:]
+            self.send(pong_response + "\r\n")
             if self.args.verbose:
-                print(f"{Colors.GREEN}✅ [{timestamp}] PONG enviado: {pong_response}{Colors.RESET}")
+                self.echo(f"{Colors.GREEN}✅ [{timestamp}] PONG enviado: {pong_response}{Colors.RESET}")
             return
         
+        if command == "005":
+            self.update_isupport(msg)
+        
         # ✅ Filtrar mensagens técnicas que quebram a interface
         technical_patterns = ["CHANMODES", "MAXLIST", "TARGMAX", "PREFIX", "MODES", 
                              "NETWORK", "CASEMAPPING", "NICKLEN", "CHANNELLEN"]
-        if any(pattern in data for pattern in technical_patterns):
+        if command in ("004", "005") and any(pattern in data for pattern in technical_patterns):
             if self.args.verbose:
-                print(f"{Colors.YELLOW}⚡ [{timestamp}] [Ignorado] {data}{Colors.RESET}")
+                self.echo(f"{Colors.YELLOW}⚡ [{timestamp}] [Ignorado] {data}{Colors.RESET}")
             return
         
         # Mensagem de usuário
-        if "PRIVMSG" in data:
-            try:
-                parts = data.split(' ', 3)
-                sender = parts[0][1:].split('!')[0]
-                target = parts[2]
-                message = parts[3][1:] if parts[3].startswith(':') else parts[3]
-                
-                if target == self.config['nickname']:
-                    # Mensagem privada
-                    print(f"{Colors.MAGENTA}[{timestamp}] ✉️ {sender}: {message}{Colors.RESET}")
-                else:
-                    # Mensagem em canal
-                    print(f"{Colors.CYAN}[{timestamp}] <{sender}@{target}> {Colors.WHITE}{message}{Colors.RESET}")
-                    self.current_channel = target
-                    
-            except (IndexError, ValueError):
+        if command == "PRIVMSG":
+            if len(params) < 2:
                 if self.args.verbose:
-                    print(f"{Colors.YELLOW}⚡ [{timestamp}] {data}{Colors.RESET}")
+                    self.echo(f"{Colors.YELLOW}⚡ [{timestamp}] {data}{Colors.RESET}")
+                return
+            sender = msg['nick']
+            target, message = params[0], params[-1]
+            if message.startswith('\x01'):
+                self.handle_ctcp(sender, target, message, timestamp)
+                return
+            if 'scdpi/encrypted' in msg['tags']:
+                message = f"🔒 {message}"
+            conversation = sender if target == self.config['nickname'] else target
+            if not self.record_message(conversation, sender, message, msg['tags']):
+                return
+            private = target == self.config['nickname']
+            # Privadas contam como destaque salvo "enable_private_messages": false
+            highlight = (private and self.settings.notify_private) or self.settings.is_highlight(message)
+            self.activity.add(conversation, highlight,
+                              active=conversation.lower() == (self.current_channel or '').lower())
+            if target != self.config['nickname']:
+                self.update_channel_stats(target, sender, message, timestamp)
+            
+            if private:
+                # Mensagem privada
+                self.echo(f"{Colors.MAGENTA}[{timestamp}] ✉️ {sender}: {message}{Colors.RESET}",
+                          window=sender, activity="highlight" if highlight else "message")
+            elif highlight:
+                # Menção ao nick ou palavra de destaque
+                self.echo(f"{Colors.BOLD}{Colors.YELLOW}[{timestamp}] 🔔 <{sender}@{target}> {message}{Colors.RESET}",
+                          window=target, activity="highlight")
+            else:
+                # Mensagem em canal
+                self.echo(f"{Colors.CYAN}[{timestamp}] <{sender}@{target}> {Colors.WHITE}{message}{Colors.RESET}",
+                          window=target, activity="message")
         
         # Outras mensagens importantes
-        elif "001" in data:  # Welcome
-            print(f"{Colors.GREEN}[{timestamp}] ✅ Conectado ao servidor!{Colors.RESET}")
-            for channel in self.config.get('channels', []):
+        elif command == "001":  # Welcome
+            self.echo(f"{Colors.GREEN}[{timestamp}] ✅ Conectado ao servidor!{Colors.RESET}")
+            configured = {c.lower() for c in self.settings.channels}
+            restored = sorted(c for c in self.joined_channels if c.lower() not in configured)
+            for channel in list(self.settings.channels) + restored:
                 self.send(f"JOIN {channel}\r\n")
-                print(f"{Colors.BLUE}[{timestamp}] 🚪 Entrando em {channel}...{Colors.RESET}")
+                self.echo(f"{Colors.BLUE}[{timestamp}] 🚪 Entrando em {channel}...{Colors.RESET}", window=channel)
                 self.joined_channels.add(channel)
         
-        elif "433" in data:  # Nick em uso
+        elif command == "433":  # Nick em uso
             new_nick = f"{self.config['nickname']}_{os.getpid()}"
-            print(f"{Colors.YELLOW}[{timestamp}] ⚠️ Nick em uso, tentando {new_nick}...{Colors.RESET}")
+            self.echo(f"{Colors.YELLOW}[{timestamp}] ⚠️ Nick em uso, tentando {new_nick}...{Colors.RESET}",
+                      level="warning")
             self.config['nickname'] = new_nick
             self.send(f"NICK {new_nick}\r\n")
         
-        elif "PART" in data or "QUIT" in data:
-            parts = data.split(' ')
-            if len(parts) > 2:
-                channel = parts[2]
-                if channel in self.joined_channels:
-                    self.joined_channels.remove(channel)
-                    if channel == self.current_channel:
-                        self.current_channel = None
-                    print(f"{Colors.BLUE}[{timestamp}] 👋 Saiu de {channel}{Colors.RESET}")
+        elif command == "353":  # RPL_NAMREPLY
+            if len(params) >= 4:
+                channel = params[2]
+                cached = self.replies.record("names", channel, lambda: {"channel": channel, "names": {}})["names"]
+                members = self.channel_members.get(channel.lower())
+                prefixes = self.member_prefixes()
+                for entry in params[3].split():
+                    nick = entry.lstrip(prefixes)
+                    cached[nick] = entry[:len(entry) - len(nick)]
+                    if members is not None:
+                        members[nick] = cached[nick]
+        
+        elif command == "366" and len(params) >= 2:  # RPL_ENDOFNAMES
+            self.replies.complete("names", params[1])
+        
+        elif command == "CAP" and len(params) >= 3:
+            self.handle_cap(params)
+        
+        elif command == "321":  # RPL_LISTSTART
+            if not self.directory.collecting:
+                self.directory.begin(None)
+        
+        elif command == "322" and len(params) >= 3:  # RPL_LIST
+            users = int(params[2]) if params[2].isdigit() else 0
+            self.directory.add(params[1], users, params[3] if len(params) > 3 else '')
+        
+        elif command == "323":  # RPL_LISTEND
+            self.directory.finish()
+            if self.pending_list:
+                query, self.pending_list = self.pending_list, None
+                self.show_list(query, cached=False)
+        
+        elif command in WHOIS_NUMERICS and len(params) >= 2:
+            self.handle_whois_reply(command, params)
+        
+        elif command in ("352", "315") and len(params) >= 2:  # RPL_WHOREPLY / RPL_ENDOFWHO
+            self.handle_who_reply(command, params)
+        
+        elif command == "PONG" and (msg['trailing'] or '').startswith('lag-'):
+            try:
+                self.lag = time.monotonic() - float(msg['trailing'][4:])
+            except ValueError:
+                pass
+        
+        elif command == "AWAY":
+            self.replies.away_changed(msg['nick'], msg['trailing'])
+        
+        elif command in ("332", "333") and len(params) >= 3:  # RPL_TOPIC / RPL_TOPICWHOTIME
+            topic = self.channel_topics.setdefault(params[1].lower(), {"topic": "", "setter": "", "time": 0})
+            if command == "332":
+                topic["topic"] = params[2]
+            elif len(params) >= 4 and params[3].isdigit():
+                topic["setter"], topic["time"] = params[2], int(params[3])
+        
+        elif command == "TOPIC" and len(params) >= 2:
+            self.channel_topics[params[0].lower()] = {"topic": params[1], "setter": msg['nick'], "time": int(time.time())}
+        
+        elif command == "MODE" and len(params) >= 2 and params[0][:1] in '#&+!':
+            self.apply_channel_modes(params[0], params[1], params[2:])
+        
+        elif command == "JOIN" and params:
+            channel = params[0]
+            if msg['nick'] == self.config['nickname']:
+                self.joined_channels.add(channel)
+                self.channel_members[channel.lower()] = {msg['nick']: ''}
+                self.channel_topics.pop(channel.lower(), None)
+                self.fetch_history(channel)
+                if self.current_channel is None:
+                    self.activate(channel)
+            else:
+                self.channel_members.setdefault(channel.lower(), {})[msg['nick']] = ''
+                self.replies.member_joined(channel, msg['nick'])
+                if self.floods.add("join", channel, msg['nick']):
+                    self.echo(f"{Colors.BLUE}[{timestamp}] → {msg['nick']} entrou em {channel}{Colors.RESET}", window=channel)
+        
+        elif command in ("PART", "KICK") and params:
+            channel = params[0]
+            nick = params[1] if command == "KICK" and len(params) > 1 else msg['nick']
+            if nick == self.config['nickname']:
+                self.joined_channels.discard(channel)
+                self.channel_members.pop(channel.lower(), None)
+                self.channel_topics.pop(channel.lower(), None)
+                self.channel_stats.pop(channel.lower(), None)
+                self.activity.remove(channel)
+                if channel == self.current_channel:
+                    self.activate(None)
+                self.echo(f"{Colors.BLUE}[{timestamp}] 👋 Saiu de {channel}{Colors.RESET}", window=channel)
+            else:
+                self.channel_members.get(channel.lower(), {}).pop(nick, None)
+                self.replies.member_left(channel, nick)
+                if self.floods.add("part", channel, nick):
+                    self.echo(f"{Colors.BLUE}[{timestamp}] ← {nick} saiu de {channel}{Colors.RESET}", window=channel)
+        
+        elif command == "QUIT":
+            nick, reason = msg['nick'], msg['trailing'] or ''
+            self.replies.user_quit(nick)
+            for channel, members in self.channel_members.items():
+                if nick in members:
+                    del members[nick]
+                    if self.floods.add("quit", channel, nick, reason):
+                        self.echo(f"{Colors.BLUE}[{timestamp}] ⇠ {nick} saiu de {channel} ({reason}){Colors.RESET}",
+                                  window=channel)
+        
+        elif command == "NICK" and params:
+            old_nick, new_nick = msg['nick'], params[0]
+            self.replies.nick_changed(old_nick, new_nick)
+            for members in self.channel_members.values():
+                if old_nick in members:
+                    members[new_nick] = members.pop(old_nick)
+            if old_nick == self.config['nickname']:
+                self.config['nickname'] = new_nick
+                self.settings.compile_highlights(new_nick)
         
         else:
             # Mensagens gerais do servidor
             if self.args.verbose:
-                print(f"{Colors.YELLOW}⚡ [{timestamp}] {data}{Colors.RESET}")
+                self.echo(f"{Colors.YELLOW}⚡ [{timestamp}] {data}{Colors.RESET}")
     
     def handle_user_input(self):
         """Processa entrada do usuário"""
@@ -319,20 +3259,24 @@ class SCDPIChatUniversal:
                 prompt += f"{Colors.WHITE}@{Colors.CYAN}{self.current_channel}"
             prompt += f"{Colors.GREEN}> {Colors.RESET}"
             
-            user_input = input(prompt).strip()
-            
-            if user_input.startswith('/'):
-                self.handle_command(user_input[1:])
-            elif user_input and self.current_channel:
-                self.send(f"PRIVMSG {self.current_channel} :{user_input}\r\n")
-                print(f"{Colors.CYAN}[{datetime.now().strftime('%H:%M:%S')}] <{self.config['nickname']}@{self.current_channel}> {Colors.WHITE}{user_input}{Colors.RESET}")
-            elif user_input:
-                print(f"{Colors.RED}❌ Não está em nenhum canal. Use /join #canal{Colors.RESET}")
+            self.process_input(input(prompt).strip())
                 
         except (EOFError, KeyboardInterrupt):
             self.running = False
         except Exception as e:
-            print(f"{Colors.RED}❌ Erro no input: {e}{Colors.RESET}")
+            self.echo(f"{Colors.RED}❌ Erro no input: {e}{Colors.RESET}", level="error")
+    
+    def process_input(self, user_input):
+        """Executa um comando ou envia a linha digitada ao canal atual"""
+        if user_input.startswith('/'):
+            self.handle_command(user_input[1:])
+        elif user_input and self.current_channel:
+            self.send_privmsg(self.current_channel, user_input)
+            self.record_message(self.current_channel, self.config['nickname'], user_input)
+            self.echo(f"{Colors.CYAN}[{datetime.now().strftime('%H:%M:%S')}] <{self.config['nickname']}@{self.current_channel}> {Colors.WHITE}{user_input}{Colors.RESET}",
+                      window=self.current_channel)
+        elif user_input:
+            self.echo(f"{Colors.RED}❌ Não está em nenhum canal. Use /join #canal{Colors.RESET}", level="error")
     
     def handle_command(self, command):
         """Processa comandos do usuário"""
@@ -346,37 +3290,39 @@ class SCDPIChatUniversal:
             if not args.startswith('#'):
                 args = '#' + args
             self.send(f"JOIN {args}\r\n")
-            self.current_channel = args
             self.joined_channels.add(args)
-            print(f"{Colors.BLUE}[{timestamp}] 🚪 Entrando em {args}...{Colors.RESET}")
+            self.activate(args)
+            self.echo(f"{Colors.BLUE}[{timestamp}] 🚪 Entrando em {args}...{Colors.RESET}", window=args)
             
         elif cmd == "part":
             channel = args or self.current_channel
             if channel:
                 self.send(f"PART {channel}\r\n")
-                print(f"{Colors.BLUE}[{timestamp}] 👋 Saindo de {channel}{Colors.RESET}")
+                self.echo(f"{Colors.BLUE}[{timestamp}] 👋 Saindo de {channel}{Colors.RESET}")
                 if channel in self.joined_channels:
                     self.joined_channels.remove(channel)
+                self.activity.remove(channel)
                 if channel == self.current_channel:
-                    self.current_channel = None
+                    self.activate(None)
             else:
-                print(f"{Colors.RED}[{timestamp}] ❌ Não está em nenhum canal{Colors.RESET}")
+                self.echo(f"{Colors.RED}[{timestamp}] ❌ Não está em nenhum canal{Colors.RESET}", level="error")
                 
         elif cmd == "msg" and args:
             if ' ' in args:
                 target, message = args.split(' ', 1)
-                self.send(f"PRIVMSG {target} :{message}\r\n")
-                print(f"{Colors.MAGENTA}[{timestamp}] ✉️ Para {target}: {message}{Colors.RESET}")
+                self.send_privmsg(target, message)
+                self.record_message(target, self.config['nickname'], message)
+                self.echo(f"{Colors.MAGENTA}[{timestamp}] ✉️ Para {target}: {message}{Colors.RESET}", window=target)
             else:
-                print(f"{Colors.RED}[{timestamp}] ❌ Uso: /msg nick mensagem{Colors.RESET}")
+                self.echo(f"{Colors.RED}[{timestamp}] ❌ Uso: /msg nick mensagem{Colors.RESET}", level="error")
                 
         elif cmd == "nick" and args:
             if ' ' in args:
-                print(f"{Colors.RED}[{timestamp}] ❌ Nickname não pode conter espaços{Colors.RESET}")
+                self.echo(f"{Colors.RED}[{timestamp}] ❌ Nickname não pode conter espaços{Colors.RESET}", level="error")
                 return
             self.send(f"NICK {args}\r\n")
             self.config['nickname'] = args
-            print(f"{Colors.GREEN}[{timestamp}] ✅ Nickname alterado para {args}{Colors.RESET}")
+            self.echo(f"{Colors.GREEN}[{timestamp}] ✅ Nickname alterado para {args}{Colors.RESET}")
             
         elif cmd == "quit":
             self.running = False
@@ -385,109 +3331,552 @@ class SCDPIChatUniversal:
             self.show_help()
             
         elif cmd == "clear":
-            self.clear_screen()
-            self.print_banner()
+            if self.tui:
+                self.tui.clear()
+            else:
+                self.clear_screen()
+                self.print_banner()
+            
+        elif cmd == "dcc":
+            self.handle_dcc_command(args, timestamp)
             
-        elif cmd == "names" and args:
-            self.send(f"NAMES {args}\r\n")
+        elif cmd == "key" and args:
+            self.handle_key_command(args, timestamp)
             
-        elif cmd == "whois" and args:
-            self.send(f"WHOIS {args}\r\n")
+        elif cmd == "list":
+            self.list_channels(args)
             
+        elif cmd == "top":
+            channel = args.strip() or self.current_channel
+            if channel:
+                self.show_top(channel, timestamp)
+            else:
+                self.echo(f"{Colors.RED}[{timestamp}] ❌ Uso: /top #canal{Colors.RESET}", level="error")
+            
+        elif cmd == "next":
+            target = self.activity.next()
+            if target:
+                self.activate(target)
+            else:
+                self.echo(f"{Colors.YELLOW}[{timestamp}] Nenhuma mensagem não lida{Colors.RESET}")
+            
+        elif cmd in ("w", "window"):
+            self.handle_window_command(args.strip(), timestamp)
+            
+        elif cmd == "rate":
+            self.show_rates(args.strip() or None, timestamp)
+            
+        elif cmd == "reload":
+            self.reload_config()
+            
+        elif cmd == "plugins":
+            lines = self.plugins.report()
+            if not lines:
+                self.echo(f"{Colors.YELLOW}[{timestamp}] Nenhum plugin carregado ({self.plugins.directory}){Colors.RESET}")
+            for line in lines:
+                self.echo(f"{Colors.MAGENTA}[{timestamp}] 🧩 {line}{Colors.RESET}")
+            
+        elif cmd in ("names", "whois", "who") and args:
+            kind = cmd
+            self.lookup(kind, args.split()[0], lambda record, cached: self.show_reply(kind, record, cached))
+            
+        else:
+            self.echo(f"{Colors.RED}[{timestamp}] ❌ Comando desconhecido: {cmd}{Colors.RESET}", level="error")
+    
+    def handle_window_command(self, args, timestamp):
+        """/w mostra as não lidas; /w #canal, /w nick ou /w N (número na TUI) troca a janela ativa"""
+        if not args:
+            pending = self.activity.pending()
+            if not pending:
+                self.echo(f"{Colors.YELLOW}[{timestamp}] Nenhuma mensagem não lida{Colors.RESET}")
+            for entry in pending:
+                mark = " 🔔" if entry.highlights else ""
+                read = f" (lido às {datetime.fromtimestamp(entry.last_read).strftime('%H:%M')})" if entry.last_read else ""
+                self.echo(f"{Colors.CYAN}[{timestamp}] {entry.name}: {entry.unread} não lidas{mark}{read}{Colors.RESET}")
+            return
+        target = args
+        if args.isdigit() and not self.tui:
+            # Números só identificam janelas na TUI; aqui virariam um nick "3"
+            self.echo(f"{Colors.RED}[{timestamp}] ❌ /w N só funciona com --tui; use /w #canal ou /w nick{Colors.RESET}",
+                      level="error")
+            return
+        if args.isdigit():
+            target = self.tui.window_at(int(args))
+            if target is None:
+                self.echo(f"{Colors.RED}[{timestamp}] ❌ Janela {args} não existe{Colors.RESET}", level="error")
+                return
+            if target == TerminalUI.STATUS:
+                target = None
+        self.activate(target)
+    
+    def handle_dcc_command(self, args, timestamp):
+        """/dcc send nick arquivo | get id | close id | list"""
+        parts = args.split(' ', 2)
+        sub = parts[0].lower()
+        if sub == "send" and len(parts) == 3:
+            self.dcc.offer(parts[1], parts[2])
+        elif sub in ("get", "close") and len(parts) == 2 and parts[1].isdigit():
+            if sub == "get":
+                self.dcc.accept(int(parts[1]))
+            else:
+                self.dcc.cancel(int(parts[1]))
+        elif sub in ("list", ""):
+            lines = self.dcc.status_lines()
+            if not lines:
+                self.echo(f"{Colors.YELLOW}[{timestamp}] Nenhuma transferência DCC{Colors.RESET}")
+            for line in lines:
+                self.echo(f"{Colors.BLUE}[{timestamp}] {line}{Colors.RESET}")
+        else:
+            self.echo(f"{Colors.RED}[{timestamp}] ❌ Uso: /dcc send nick arquivo | get id | close id | list{Colors.RESET}",
+                      level="error")
+    
+    def handle_key_command(self, args, timestamp):
+        """/key alvo segredo | /key -d alvo"""
+        if AESGCM is None:
+            self.echo(f"{Colors.RED}[{timestamp}] ❌ Instale o pacote 'cryptography' para usar /key{Colors.RESET}",
+                      level="error")
+            return
+        parts = args.split(' ', 1)
+        if parts[0] == "-d" and len(parts) == 2:
+            if self.crypto:
+                self.crypto.remove_key(parts[1].strip())
+            self.echo(f"{Colors.YELLOW}[{timestamp}] 🔓 Criptografia desativada para {parts[1].strip()}{Colors.RESET}")
+        elif len(parts) == 2:
+            if self.crypto is None:
+                self.crypto = ChannelCrypto()
+            previous = self.crypto.keys.get(ChannelCrypto._key_id(parts[0]))
+            self.crypto.set_key(parts[0], parts[1].strip())
+            try:
+                # Derivar já: uma chave inválida é recusada aqui, não no próximo envio
+                self.crypto._cipher(parts[0])
+            except ValueError as e:
+                if previous is None:
+                    self.crypto.remove_key(parts[0])
+                else:
+                    self.crypto.set_key(parts[0], previous)
+                self.echo(f"{Colors.RED}[{timestamp}] ❌ {e}{Colors.RESET}", level="error")
+                return
+            self.echo(f"{Colors.GREEN}[{timestamp}] 🔒 Criptografia ativada para {parts[0]}{Colors.RESET}")
         else:
-            print(f"{Colors.RED}[{timestamp}] ❌ Comando desconhecido: {cmd}{Colors.RESET}")
+            self.echo(f"{Colors.RED}[{timestamp}] ❌ Uso: /key alvo segredo | /key -d alvo{Colors.RESET}", level="error")
     
     def show_help(self):
         """Mostra ajuda de comandos"""
-        terminal_width = os.get_terminal_size().columns
+        terminal_width = shutil.get_terminal_size().columns
         padding = (terminal_width - 50) // 2
         
-        print(f"{Colors.BOLD}{Colors.GREEN}")
-        print(" " * padding + "📋 Comandos Disponíveis:")
-        print(f"{Colors.RESET}")
-        print(f"{Colors.YELLOW}/join #canal    {Colors.WHITE}- Entrar em canal")
-        print(f"{Colors.YELLOW}/part [canal]   {Colors.WHITE}- Sair do canal")
-        print(f"{Colors.YELLOW}/msg nick msg   {Colors.WHITE}- Mensagem privada")
-        print(f"{Colors.YELLOW}/nick novo_nick {Colors.WHITE}- Mudar nickname")
-        print(f"{Colors.YELLOW}/names #canal   {Colors.WHITE}- Listar usuários")
-        print(f"{Colors.YELLOW}/whois nick     {Colors.WHITE}- Informações do usuário")
-        print(f"{Colors.YELLOW}/quit           {Colors.WHITE}- Sair")
-        print(f"{Colors.YELLOW}/help           {Colors.WHITE}- Esta ajuda")
-        print(f"{Colors.YELLOW}/clear          {Colors.WHITE}- Limpar tela{Colors.RESET}")
+        self.echo(f"{Colors.BOLD}{Colors.GREEN}")
+        self.echo(" " * padding + "📋 Comandos Disponíveis:")
+        self.echo(f"{Colors.RESET}")
+        self.echo(f"{Colors.YELLOW}/join #canal    {Colors.WHITE}- Entrar em canal")
+        self.echo(f"{Colors.YELLOW}/part [canal]   {Colors.WHITE}- Sair do canal")
+        self.echo(f"{Colors.YELLOW}/msg nick msg   {Colors.WHITE}- Mensagem privada")
+        self.echo(f"{Colors.YELLOW}/nick novo_nick {Colors.WHITE}- Mudar nickname")
+        self.echo(f"{Colors.YELLOW}/names #canal   {Colors.WHITE}- Listar usuários")
+        self.echo(f"{Colors.YELLOW}/whois nick     {Colors.WHITE}- Informações do usuário")
+        self.echo(f"{Colors.YELLOW}/who máscara    {Colors.WHITE}- Listar usuários por máscara")
+        self.echo(f"{Colors.YELLOW}/list [--min N --match txt --sort users] {Colors.WHITE}- Diretório de canais")
+        self.echo(f"{Colors.YELLOW}/top [#canal]   {Colors.WHITE}- Quem mais fala, URLs e palavras")
+        self.echo(f"{Colors.YELLOW}/rate [#canal]  {Colors.WHITE}- Mensagens por minuto")
+        self.echo(f"{Colors.YELLOW}/next           {Colors.WHITE}- Ir para o canal mais importante com não lidas")
+        self.echo(f"{Colors.YELLOW}/w [alvo|N]     {Colors.WHITE}- Trocar de janela (sem argumento: lista as não lidas)")
+        self.echo(f"{Colors.YELLOW}/plugins        {Colors.WHITE}- Tempo gasto por plugin")
+        self.echo(f"{Colors.YELLOW}/reload         {Colors.WHITE}- Recarregar configuração sem reconectar")
+        self.echo(f"{Colors.YELLOW}/key alvo senha {Colors.WHITE}- Cifrar mensagens do canal/query")
+        self.echo(f"{Colors.YELLOW}/dcc send nick arquivo {Colors.WHITE}- Enviar arquivo (get/close/list)")
+        self.echo(f"{Colors.YELLOW}/quit           {Colors.WHITE}- Sair")
+        self.echo(f"{Colors.YELLOW}/help           {Colors.WHITE}- Esta ajuda")
+        self.echo(f"{Colors.YELLOW}/clear          {Colors.WHITE}- Limpar tela{Colors.RESET}")
+        if self.tui:
+            self.echo(f"{Colors.YELLOW}Ctrl-N / Ctrl-P {Colors.WHITE}- Próxima/anterior janela (PgUp/PgDn rolam){Colors.RESET}")
+            self.echo(f"{Colors.YELLOW}Alt-A / Alt-1..9 {Colors.WHITE}- /next / janela pelo número{Colors.RESET}")
     
     def reconnect(self):
         """Tenta reconectar ao servidor em caso de falha"""
         if self.reconnect_attempts >= self.max_reconnect_attempts:
-            print(f"{Colors.RED}❌ Máximo de tentativas de reconexão atingido{Colors.RESET}")
+            self.echo(f"{Colors.RED}❌ Máximo de tentativas de reconexão atingido{Colors.RESET}", level="error")
             self.running = False
+            self.exit_status = 1
             return False
         
-        print(f"{Colors.YELLOW}⚠️ Tentando reconectar... (Tentativa {self.reconnect_attempts + 1}/{self.max_reconnect_attempts}){Colors.RESET}")
+        self.echo(f"{Colors.YELLOW}⚠️ Tentando reconectar... (Tentativa {self.reconnect_attempts + 1}/{self.max_reconnect_attempts}){Colors.RESET}",
+                  level="warning")
         time.sleep(2 ** self.reconnect_attempts)  # Exponential backoff
         self.reconnect_attempts += 1
         if self.connect():
             # Reentrar nos canais
             for channel in self.joined_channels:
                 self.send(f"JOIN {channel}\r\n")
-                print(f"{Colors.BLUE}🚪 Reentrando em {channel}...{Colors.RESET}")
+                self.echo(f"{Colors.BLUE}🚪 Reentrando em {channel}...{Colors.RESET}")
             return True
         return False
     
+    def replay_capture(self, path):
+        """Passa os bytes recebidos de uma captura pelo handle_message, sem rede"""
+        self.replaying = True
+        count = 0
+        for stamp, direction, data in read_capture(path):
+            if direction != '<':
+                continue
+            for line in self.split_lines(data):
+                self.handle_message(line)
+                count += 1
+        self.flush_floods(force=True)
+        self.echo(f"{Colors.GREEN}✅ Replay concluído: {count} linhas de {path}{Colors.RESET}")
+    
     def run(self):
         """Loop principal de execução"""
         if self.args.version:
             print("SCDPI CHAT v2.3 - Cliente IRC com reconexão automática")
             return
-            
-        self.clear_screen()
-        self.print_banner()
         
-        if not self.connect():
-            print(f"{Colors.RED}❌ Falha na conexão. Verifique:{Colors.RESET}")
-            print(f"1. Internet conectada")
-            print(f"2. Servidor {self.config['server']} online")
-            print(f"3. Porta {self.config['port']} aberta")
-            print(f"4. Nickname único")
+        if self.args.replay:
+            self.replay_capture(self.args.replay)
+            if self.jsonl:
+                self.jsonl.close()
             return
         
+        if self.tui:
+            self.tui.start()
+        elif not self.jsonl:
+            self.clear_screen()
+            self.print_banner()
+        
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, 'reload_requested', True))
+        
+        if self.args.bouncer is not None:
+            settings = dict(self.config.get('bouncer', {}))
+            if self.args.bouncer:
+                settings['port'] = self.args.bouncer
+            try:
+                self.bouncer = Bouncer(self, settings)
+            except (OSError, ssl.SSLError) as e:
+                self.close_tui()
+                self.echo(f"{Colors.RED}❌ Bouncer: não foi possível escutar: {e}{Colors.RESET}", level="error")
+                return 1
+            address = self.bouncer.listener.getsockname()
+            tls = " (TLS)" if self.bouncer.ssl_context else ""
+            self.echo(f"{Colors.GREEN}🔌 Bouncer escutando em {address[0]}:{address[1]}{tls}{Colors.RESET}")
+        
+        # Conectar em segundo plano enquanto o estado anterior é exibido
+        connected = []
+        connector = threading.Thread(target=lambda: connected.append(self.connect()), name="connect", daemon=True)
+        connector.start()
+        self.restore_session()
+        connector.join()
+        
+        if not connected[0]:
+            self.close_tui()
+            self.echo(f"{Colors.RED}❌ Falha na conexão. Verifique:{Colors.RESET}", level="error")
+            self.echo(f"1. Internet conectada", level="error")
+            self.echo(f"2. Servidor {self.config['server']} online", level="error")
+            self.echo(f"3. Porta {self.config['port']} aberta", level="error")
+            self.echo(f"4. Nickname único", level="error")
+            return 1
+        
         try:
             while self.running:
                 try:
-                    data = self.receive()
-                    if data:
-                        for line in data.split('\r\n'):
-                            if line.strip():
-                                self.handle_message(line)
+                    # Na TUI o teclado é lido sem bloquear: esperar pouco pela rede
+                    wait = 0.05 if self.tui else 0.5
+                    if self.bouncer:
+                        # Acorda com atividade do upstream ou de qualquer cliente local
+                        self.bouncer.poll(wait, upstream=self.socket)
+                        lines = self.receive(0.001)
                     else:
-                        # Verificar conexão
-                        self.send("PING :keepalive\r\n")
-                        
-                    self.handle_user_input()
-                    time.sleep(0.1)
+                        lines = self.receive(wait)
+                    if lines:
+                        for line in lines:
+                            self.handle_message(line)
+                    if time.monotonic() - self.ping_sent > 30:
+                        # Verificar conexão e medir o lag (respondido no PONG)
+                        self.ping_sent = time.monotonic()
+                        self.send(f"PING :lag-{self.ping_sent:.3f}\r\n")
+                    self.flush_floods()
+                    self.plugins.poll(self.send)
+                    self.check_config_reload()
+                    self.save_session()
+                    
+                    if self.tui:
+                        for line in self.tui.poll_input():
+                            try:
+                                self.process_input(line)
+                            except Exception as e:
+                                self.echo(f"{Colors.RED}❌ Erro no input: {e}{Colors.RESET}", level="error")
+                        self.tui.set_status(self.config['nickname'], self.lag)
+                        self.tui.render()
+                    # No modo JSON lines e no bouncer o cliente é headless: sem prompt nem pausa
+                    elif not self.jsonl and not self.bouncer:
+                        self.handle_user_input()
+                        time.sleep(0.1)
                     
                 except (ConnectionResetError, BrokenPipeError, OSError):
-                    print(f"{Colors.RED}❌ Conexão perdida!{Colors.RESET}")
+                    self.echo(f"{Colors.RED}❌ Conexão perdida!{Colors.RESET}", level="error")
+                    self.plugins.dispatch("disconnect", {"server": self.config['server']})
                     if not self.reconnect():
                         break
                 
         except KeyboardInterrupt:
-            print(f"\n{Colors.YELLOW}🛑 Desconectando...{Colors.RESET}")
+            self.echo(f"\n{Colors.YELLOW}🛑 Desconectando...{Colors.RESET}")
         except Exception as e:
-            print(f"{Colors.RED}❌ Erro crítico: {e}{Colors.RESET}")
+            self.echo(f"{Colors.RED}❌ Erro crítico: {e}{Colors.RESET}", level="error")
         finally:
+            self.close_tui()
             if self.socket:
                 try:
                     self.send("QUIT :SCDPI CHAT saindo\r\n")
                     self.socket.close()
                 except:
                     pass
-            print(f"{Colors.GREEN}✅ Conexão encerrada{Colors.RESET}")
+            self.save_session(force=True)
+            self.dcc.shutdown()
+            self.plugins.shutdown()
+            if self.bouncer:
+                self.bouncer.close()
+            if self.capture:
+                self.capture.close()
+            if self.jsonl:
+                self.jsonl.close()
+            self.echo(f"{Colors.GREEN}✅ Conexão encerrada{Colors.RESET}")
+        return self.exit_status
+
+# ── Modo swarm (teste de carga) ──────────────────────────────────
+
+class LatencyHistogram:
+    """Histograma logarítmico de latências, mesclável entre processos"""
+    
+    BUCKETS_PER_DECADE = 20
+    MIN = 1e-6
+    
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.max = 0.0
+    
+    def add(self, seconds):
+        seconds = max(seconds, self.MIN)
+        bucket = int(math.log10(seconds / self.MIN) * self.BUCKETS_PER_DECADE)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.max = max(self.max, seconds)
+    
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+    
+    def percentile(self, pct):
+        """Limite superior do bucket que contém o percentil pedido"""
+        if not self.total:
+            return 0.0
+        wanted = self.total * pct / 100.0
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= wanted:
+                return min(self.MIN * 10 ** ((bucket + 1) / self.BUCKETS_PER_DECADE), self.max)
+        return self.max
+    
+    def summary(self):
+        return (f"p50={self.percentile(50) * 1000:.1f}ms p95={self.percentile(95) * 1000:.1f}ms "
+                f"p99={self.percentile(99) * 1000:.1f}ms max={self.max * 1000:.1f}ms (n={self.total})")
+
+class SwarmStats:
+    """Métricas coletadas pelas sessões de um processo do swarm"""
+    
+    def __init__(self):
+        self.connect = LatencyHistogram()
+        self.delivery = LatencyHistogram()
+        self.sessions = 0
+        self.registered = 0
+        self.sent = 0
+        self.errors = {}
+    
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+    
+    def merge(self, other):
+        self.connect.merge(other.connect)
+        self.delivery.merge(other.delivery)
+        self.sessions += other.sessions
+        self.registered += other.registered
+        self.sent += other.sent
+        for kind, count in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + count
+
+DEFAULT_SCENARIO = {
+    "nick_prefix": "swarm",
+    "groups": 1,
+    "connect_rate": 100,
+    "timeout": 30,
+    "linger": 5,
+    "actions": [
+        {"join": "#swarm-{g}"},
+        {"sleep": 2},
+        {"say": "#swarm-{g}", "count": 10, "interval": 1},
+        {"part": "#swarm-{g}"},
+    ],
+}
+
+async def _swarm_session(index, config, scenario, stats, ssl_context):
+    """Uma sessão headless: conecta, registra e executa o roteiro"""
+    stats.sessions += 1
+    nick = f"{scenario['nick_prefix']}{index}"
+    fields = {"i": index, "g": index % max(1, scenario['groups'])}
+    timeout = scenario['timeout']
+    started = time.perf_counter()
+    
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(config['server'], config['port'], ssl=ssl_context,
+                                    server_hostname=config['server'] if ssl_context else None),
+            timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        stats.error(f"connect:{type(e).__name__}")
+        return
+    
+    registered = asyncio.Event()
+    
+    async def read_loop():
+        nonlocal nick
+        while True:
+            raw = await reader.readline()
+            if not raw:
+                if not registered.is_set():
+                    stats.error("closed_before_001")
+                break
+            msg = parse_irc_line(raw.decode('utf-8', errors='ignore').rstrip('\r\n'))
+            command = msg['command']
+            if command == "PING":
+                writer.write(f"PONG :{msg['trailing'] or ''}\r\n".encode())
+            elif command == "PRIVMSG" and msg['trailing'] and msg['trailing'].startswith("swarm "):
+                try:
+                    stats.delivery.add(time.time() - float(msg['trailing'].split()[1]))
+                except (IndexError, ValueError):
+                    pass
+            elif command == "001":
+                stats.connect.add(time.perf_counter() - started)
+                stats.registered += 1
+                registered.set()
+            elif command == "433":
+                nick = f"{nick}_"
+                writer.write(f"NICK {nick}\r\n".encode())
+            elif command == "ERROR":
+                stats.error("server_error")
+            elif command[:1] in "45" and command.isdigit() and len(command) == 3:
+                stats.error(f"numeric:{command}")
+    
+    reader_task = asyncio.ensure_future(read_loop())
+    try:
+        for line in registration_lines(config, nick):
+            writer.write(line.encode('utf-8'))
+        await writer.drain()
+        try:
+            await asyncio.wait_for(registered.wait(), timeout)
+        except asyncio.TimeoutError:
+            stats.error("register_timeout")
+            return
+        
+        for action in scenario['actions']:
+            if 'sleep' in action:
+                await asyncio.sleep(action['sleep'])
+            elif 'join' in action:
+                writer.write(f"JOIN {action['join'].format(**fields)}\r\n".encode())
+            elif 'part' in action:
+                writer.write(f"PART {action['part'].format(**fields)}\r\n".encode())
+            elif 'say' in action:
+                target = action['say'].format(**fields)
+                for seq in range(action.get('count', 1)):
+                    writer.write(f"PRIVMSG {target} :swarm {time.time():.6f} {index} {seq}\r\n".encode())
+                    stats.sent += 1
+                    await writer.drain()
+                    await asyncio.sleep(action.get('interval', 0))
+            await writer.drain()
+        
+        await asyncio.sleep(scenario['linger'])
+        writer.write(b"QUIT :swarm concluido\r\n")
+        await writer.drain()
+    except (OSError, asyncio.IncompleteReadError) as e:
+        stats.error(f"io:{type(e).__name__}")
+    finally:
+        reader_task.cancel()
+        writer.close()
+
+async def _swarm_process(indexes, config, scenario):
+    stats = SwarmStats()
+    ssl_context = create_ssl_context() if config.get('use_ssl', True) else None
+    delay = 1.0 / scenario['connect_rate'] if scenario['connect_rate'] else 0
+    tasks = []
+    for index in indexes:
+        tasks.append(asyncio.ensure_future(_swarm_session(index, config, scenario, stats, ssl_context)))
+        if delay:
+            await asyncio.sleep(delay)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            stats.error(f"crash:{type(result).__name__}")
+    return stats
+
+def _swarm_worker(job):
+    """Ponto de entrada de cada processo do pool: várias sessões em um event loop"""
+    indexes, config, scenario = job
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_swarm_process(indexes, config, scenario))
+    finally:
+        loop.close()
+
+def run_swarm(config, sessions, procs, scenario_path=None):
+    """Distribui N sessões entre um pool de processos e exibe as métricas agregadas"""
+    scenario = dict(DEFAULT_SCENARIO)
+    if scenario_path:
+        with open(scenario_path, 'r', encoding='utf-8') as f:
+            scenario.update(json.load(f))
+    procs = max(1, min(procs, sessions))
+    # Cada processo limita sua própria taxa; dividir para manter a taxa total pedida
+    scenario['connect_rate'] = scenario['connect_rate'] / procs
+    jobs = [(range(p, sessions, procs), config, scenario) for p in range(procs)]
+    
+    print(f"{Colors.BOLD}🐝 Swarm: {sessions} sessões em {procs} processos contra "
+          f"{config['server']}:{config['port']}{Colors.RESET}")
+    started = time.perf_counter()
+    with multiprocessing.Pool(procs) as pool:
+        results = pool.map(_swarm_worker, jobs)
+    elapsed = time.perf_counter() - started
+    
+    total = SwarmStats()
+    for result in results:
+        total.merge(result)
+    
+    print(f"{Colors.GREEN}✅ Concluído em {elapsed:.1f}s: {total.registered}/{total.sessions} sessões registradas, "
+          f"{total.sent} mensagens enviadas{Colors.RESET}")
+    print(f"🔗 Latência de conexão (até 001): {total.connect.summary()}")
+    print(f"📨 Latência de entrega: {total.delivery.summary()}")
+    if total.errors:
+        print(f"{Colors.RED}❌ Erros:{Colors.RESET}")
+        for kind, count in sorted(total.errors.items(), key=lambda item: -item[1]):
+            print(f"   {kind}: {count}")
+    return total
 
 def main():
     """Função principal"""
     args = parse_arguments()
+    if args.bench_crypto:
+        benchmark_crypto()
+        return
     chat = SCDPIChatUniversal(args)
-    chat.run()
+    if args.swarm:
+        run_swarm(chat.config, args.swarm, args.swarm_procs, args.scenario)
+        return
+    sys.exit(chat.run() or 0)
 
 if __name__ == "__main__":
     main()
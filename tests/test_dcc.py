@@ -0,0 +1,82 @@
+"""Transferências DCC SEND/RESUME em loopback entre dois DccManager"""
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scdpi_chat import DccManager
+
+
+def make_pair(tmp_path):
+    """Dois clientes ("a" envia, "b" recebe) com o CTCP repassado diretamente"""
+    messages = []
+    echo = lambda text, **kwargs: messages.append(text)
+    sender = DccManager({'download_dir': str(tmp_path / "a")}, None, echo, lambda: "127.0.0.1")
+    receiver = DccManager({'download_dir': str(tmp_path / "b")}, None, echo, lambda: "127.0.0.1")
+    sender.send_ctcp = lambda nick, text: receiver.handle_ctcp("a", text[len("DCC "):])
+    receiver.send_ctcp = lambda nick, text: sender.handle_ctcp("b", text[len("DCC "):])
+    return sender, receiver, messages
+
+
+def wait_done(*transfers, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(t.state in ("concluído", "falhou", "cancelado") for t in transfers):
+            break
+        time.sleep(0.02)
+    return [t.state for t in transfers]
+
+
+def md5(path):
+    return hashlib.md5(Path(path).read_bytes()).hexdigest()
+
+
+def source_file(tmp_path, size=3 * 1024 * 1024 + 123):
+    path = tmp_path / "dados.bin"
+    path.write_bytes(os.urandom(size))
+    return path
+
+
+def test_send_recv(tmp_path):
+    source = source_file(tmp_path)
+    sender, receiver, _ = make_pair(tmp_path)
+    sender.offer("b", source)
+    incoming = receiver.transfers[1]
+    receiver.accept(incoming.id)
+    assert wait_done(sender.transfers[1], incoming) == ["concluído", "concluído"]
+    assert incoming.path == tmp_path / "b" / "dados.bin"
+    assert md5(incoming.path) == md5(source)
+
+
+def test_resume_partial_file(tmp_path):
+    source = source_file(tmp_path)
+    partial = source.read_bytes()[:1024 * 1024]
+    (tmp_path / "b").mkdir()
+    (tmp_path / "b" / "dados.bin").write_bytes(partial)
+    sender, receiver, _ = make_pair(tmp_path)
+    sender.offer("b", source)
+    incoming = receiver.transfers[1]
+    receiver.accept(incoming.id)
+    assert wait_done(sender.transfers[1], incoming) == ["concluído", "concluído"]
+    assert incoming.offset == len(partial)
+    assert sender.transfers[1].offset == len(partial)
+    assert md5(incoming.path) == md5(source)
+
+
+def test_complete_file_is_not_overwritten(tmp_path):
+    source = source_file(tmp_path, size=64 * 1024)
+    existing = tmp_path / "b" / "dados.bin"
+    existing.parent.mkdir()
+    existing.write_bytes(b"x" * (128 * 1024))
+    sender, receiver, messages = make_pair(tmp_path)
+    sender.offer("b", source)
+    incoming = receiver.transfers[1]
+    receiver.accept(incoming.id)
+    assert wait_done(sender.transfers[1], incoming) == ["concluído", "concluído"]
+    assert existing.read_bytes() == b"x" * (128 * 1024)
+    assert incoming.path == tmp_path / "b" / "dados_1.bin"
+    assert md5(incoming.path) == md5(source)
+    assert any("já existe" in message for message in messages)